@@ -0,0 +1,220 @@
+import hashlib
+import io
+import os
+import threading
+
+import magic
+import numpy as np
+
+from copy_move import scale_copy_move
+from image_context import ImageContext
+from memory_governor import image_dimensions
+from metadata import MetadataCache, extract_metadata
+from metrics import metrics
+from ml_detection import analyze_image_regions, detect_forgery_ml
+from regions import scale_regions
+from triage import triage_image
+
+# libmagic handles are costly to open and not thread-safe; share one behind a lock
+_magic = magic.Magic(mime=True)
+_magic_lock = threading.Lock()
+
+# Metadata of recently seen uploads, keyed by content hash
+metadata_cache = MetadataCache()
+
+def sniff_mime(data):
+    """MIME type of the leading bytes of a file"""
+    with _magic_lock:
+        return _magic.from_buffer(bytes(data[:2048]))
+
+def read_image_stream(stream, chunk_size=1024 * 1024):
+    """Read an uploaded image in one pass, hashing it and sniffing its type
+    
+    Returns (data, sha256_hex, mime). If the first chunk is not an image the
+    rest of the stream is not read and (None, None, mime) is returned.
+    """
+    buffer = io.BytesIO()
+    digest = hashlib.sha256()
+    chunk = stream.read(chunk_size)
+    mime = sniff_mime(chunk)
+    if not mime.startswith('image/'):
+        return None, None, mime
+    while chunk:
+        digest.update(chunk)
+        buffer.write(chunk)
+        chunk = stream.read(chunk_size)
+    return buffer.getvalue(), digest.hexdigest(), mime
+
+def analyze_metadata(image, digest=None):
+    """Analyze image metadata from a file path or the encoded bytes
+    
+    Only the header segments are read (see metadata.extract_metadata). With
+    the SHA-256 `digest` of the image, results are cached by content.
+    """
+    if digest is not None:
+        metadata = metadata_cache.get(digest)
+        if metadata is not None:
+            return metadata
+    try:
+        metadata = extract_metadata(image)
+    except Exception as e:
+        return {'error': str(e), 'has_exif': False}
+    if digest is not None:
+        metadata_cache.put(digest, metadata)
+    return metadata
+
+def convert_numpy_types(obj):
+    """Convert NumPy types to Python native types for JSON serialization"""
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy_types(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy_types(item) for item in obj]
+    return obj
+
+def run_analysis(image, pipeline, model, mode='accurate', timings=None, tiling=None, digest=None, triage=None, governor=None, reuse=None):
+    """Run metadata, forgery and region analysis on a saved upload or its bytes
+    
+    Shared by the /upload, /jobs and /batch routes and the scan CLI. With
+    `pipeline` set to None the stages run one after another in this thread.
+    Stage times are recorded in the metrics registry and, if given, in the
+    `timings` dict. `tiling` (keyword arguments for tiled_heatmap) adds a
+    sliding-window forgery heatmap and `digest` (the SHA-256 of the image)
+    lets the metadata be served from its cache. With `triage` (keyword
+    arguments for triage.triage_image) the image is screened first and only
+    analyzed in full if the screen escalates it; 'tier' in the result says
+    which of the two produced it. With `governor` (a MemoryGovernor) the
+    analysis waits for its estimated peak memory to fit the budget and
+    images too large for it are decoded at a reduced scale ('downscaled'
+    in the result). `reuse` is called with the decoded ImageContext once
+    the analysis is admitted and may return an earlier analysis to use
+    instead of running the analyzers; it is given this image's metadata.
+    Returns the JSON-ready analysis, or {'error': message, 'status': http_status}.
+    """
+    # Analyze metadata; unreadable metadata is reported in the result rather than failing it
+    with metrics.stage('exif', timings):
+        metadata = analyze_metadata(image, digest)
+    if 'error' in metadata:
+        metrics.increment('errors_total', stage='exif')
+    
+    if governor is None:
+        return analyze_decoded(image, metadata, pipeline, model, mode, timings, tiling, triage, reuse=reuse)
+    
+    # Size the analysis from the header before any pixels are decoded
+    dimensions = image_dimensions(image, metadata)
+    if dimensions is None:
+        metrics.increment('errors_total', stage='decode')
+        return {'error': 'Could not read image', 'status': 400}
+    width, height = dimensions
+    plan = governor.plan(width, height, mode, tiling is not None, pipeline is not None, metadata.get('format') == 'JPEG')
+    if plan is None:
+        metrics.increment('memory_admissions_total', decision='rejected')
+        return {'error': f'Image is too large to analyze ({width}x{height})', 'status': 413}
+    
+    with metrics.stage('memory_wait', timings):
+        admitted = governor.acquire(plan['bytes'])
+    if not admitted:
+        metrics.increment('memory_admissions_total', decision='timeout')
+        return {'error': 'Server is busy, retry later', 'status': 503}
+    metrics.increment('memory_admissions_total', decision='downscaled' if plan['reduction'] > 1 else 'admitted')
+    try:
+        return analyze_decoded(image, metadata, pipeline, model, mode, timings, tiling, triage, plan['reduction'], reuse)
+    finally:
+        governor.release(plan['bytes'])
+
+def to_full_resolution(forgery_detection, region_analysis, reduction):
+    """Map the pixel positions in analyses of a reduced decode back to the original image"""
+    if reduction > 1:
+        scale_copy_move(forgery_detection['analysis_details']['copy_move'], reduction)
+        scale_regions(region_analysis, reduction)
+
+def analyze_decoded(image, metadata, pipeline, model, mode='accurate', timings=None, tiling=None, triage=None, reduction=1, reuse=None):
+    """Decode an image at 1/`reduction` scale and run the forgery and region analysis of run_analysis"""
+    # Decode once and share the image across the analyzers
+    with metrics.stage('decode', timings):
+        if isinstance(image, bytes):
+            context = ImageContext.from_bytes(image, reduction)
+        else:
+            context = ImageContext.from_path(image, reduction)
+    if context is None:
+        metrics.increment('errors_total', stage='decode')
+        return {'error': 'Could not read image', 'status': 400}
+    
+    if metrics.enabled:
+        height, width = context.shape[:2]
+        metrics.observe_image(height * width, len(image) if isinstance(image, bytes) else os.path.getsize(image))
+    
+    # An earlier analysis of a near-identical image, recognized from the decoded pixels
+    if reuse is not None:
+        reused = reuse(context)
+        if reused is not None:
+            return {**reused, 'metadata': metadata}
+    
+    # Analyses of a reduced decode say so
+    result = {}
+    if reduction > 1:
+        height, width = context.shape[:2]
+        result['downscaled'] = {'factor': reduction, 'width': width, 'height': height}
+    
+    if model is None:
+        metrics.increment('errors_total', stage='model')
+        return {'error': 'Forgery detection failed: ML model not loaded', 'status': 500}
+    
+    # Cheap screening; most images stop here
+    screening = None
+    if triage is not None:
+        try:
+            with metrics.stage('triage', timings):
+                screening = triage_image(context, model, metadata, **triage)
+            metrics.increment('triage_total', tier='full' if screening['escalate'] else 'triage')
+        except Exception as e:
+            print(f"Triage failed, running the full analysis: {str(e)}")
+            metrics.increment('errors_total', stage='triage')
+        if screening is not None and not screening['escalate']:
+            to_full_resolution(screening['forgery_detection'], screening['region_analysis'], reduction)
+            with metrics.stage('convert', timings):
+                return convert_numpy_types({
+                    **result,
+                    'tier': 'triage',
+                    'triage': {key: screening[key] for key in ('score', 'threshold', 'signals')},
+                    'metadata': metadata,
+                    'forgery_detection': screening['forgery_detection'],
+                    'region_analysis': screening['region_analysis']
+                })
+    
+    # Detect forgery and analyze image regions
+    if pipeline is None:
+        with metrics.stage('forgery', timings):
+            forgery_detection = detect_forgery_ml(context, model, mode, tiling)
+        with metrics.stage('regions', timings):
+            region_analysis = analyze_image_regions(context)
+    else:
+        forgery_detection, region_analysis = pipeline.run(context, model, mode, timings, tiling)
+    if isinstance(forgery_detection, dict) and 'error' in forgery_detection:
+        metrics.increment('errors_total', stage='forgery')
+        return {'error': f'Forgery detection failed: {forgery_detection["error"]}', 'status': 500}
+    
+    if isinstance(region_analysis, dict) and 'error' in region_analysis:
+        metrics.increment('errors_total', stage='regions')
+        return {'error': f'Region analysis failed: {region_analysis["error"]}', 'status': 500}
+    
+    to_full_resolution(forgery_detection, region_analysis, reduction)
+    
+    # Convert NumPy types to Python native types
+    with metrics.stage('convert', timings):
+        result['tier'] = 'full'
+        if screening is not None:
+            result['triage'] = {key: screening[key] for key in ('score', 'threshold', 'signals')}
+        return convert_numpy_types({
+            **result,
+            'metadata': metadata,
+            'forgery_detection': forgery_detection,
+            'region_analysis': region_analysis
+        })
@@ -1,162 +1,603 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Request, Response, render_template, request, jsonify, send_from_directory, stream_with_context
 from werkzeug.utils import secure_filename
 import os
-import cv2
-import numpy as np
-from PIL import Image
-from exif import Image as ExifImage
-import magic
 import json
 from datetime import datetime
+import threading
 import traceback
-from ml_detection import load_model, detect_forgery_ml, analyze_image_regions
-from report_generator import generate_report
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from analysis import metadata_cache, read_image_stream, run_analysis, sniff_mime
+from copy_move import COPY_MOVE_MODES
+from inference_engine import InferenceEngine
+from jobs import JobQueue, create_job_records
+from memory_governor import MemoryGovernor
+from metrics import metrics
+from phash_index import PerceptualHashIndex, gray_hashes
+from ml_detection import ANALYSIS_VERSION, load_model, optimize_model, warmup_model
+from pipeline import PipelineExecutor
+from report_renderer import ReportRenderer
+from result_cache import ResultCache, content_hash
+from results_store import create_results_store, make_result_id
+
+# Cold-start timings in seconds, reported at startup and on /metrics
+startup_timings = {'imports': time.perf_counter() - _import_started}
+
+class AnalysisRequest(Request):
+    """Allow larger bodies on the batch endpoint than on single uploads"""
+
+    @property
+    def max_content_length(self):
+        if self.path == '/batch':
+            return app.config['MAX_BATCH_CONTENT_LENGTH']
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = AnalysisRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['REPORTS_FOLDER'] = 'reports'
+app.config['CACHE_FOLDER'] = 'cache'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['CACHE_MEMORY_ENTRIES'] = 256
+app.config['CACHE_MAX_DISK_BYTES'] = 512 * 1024 * 1024  # 512MB of cached results on disk
+app.config['CACHE_TTL'] = 7 * 24 * 3600  # Keep cached results for a week
+app.config['INFERENCE_MAX_BATCH_SIZE'] = 8
+app.config['INFERENCE_MAX_WAIT_MS'] = 5  # How long a request waits for others to share its batch
+app.config['MODEL_HEAD'] = 'flatten'  # 'gap' swaps the 51M-parameter fc1 for global average pooling
+app.config['INFERENCE_BACKEND'] = 'eager'  # One of ml_detection.INFERENCE_BACKENDS
+app.config['INFERENCE_CHANNELS_LAST'] = False
+app.config['INFERENCE_THREADS'] = None  # Intra-op threads for torch; None keeps its default
+app.config['PIPELINE_WORKERS'] = 4
+app.config['PIPELINE_USE_PROCESSES'] = False  # Run the classical analyzers in a process pool
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_QUEUE_SIZE'] = 32  # Further submissions get 429 until the queue drains
+app.config['JOB_RETENTION'] = 1000  # Finished jobs kept for polling
+app.config['JOB_STORE'] = 'sqlite'  # Lets any gunicorn worker answer /jobs/<id>; 'memory' only suits a single process
+app.config['JOB_DB'] = os.path.join('cache', 'jobs.db')
+app.config['MAX_BATCH_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB max batch upload
+app.config['BATCH_WORKERS'] = 4
+app.config['BATCH_MAX_IN_FLIGHT'] = 8  # Images held in memory per batch while waiting for a worker
+app.config['METRICS_ENABLED'] = True  # Stage histograms for /metrics; ?timings=1 works either way
+app.config['RESULTS_STORE'] = 'sqlite'  # Shared by all gunicorn workers; 'memory' only suits a single process
+app.config['RESULTS_DB'] = os.path.join('cache', 'results.db')
+app.config['RESULTS_MAX_ENTRIES'] = 1024
+app.config['RESULTS_TTL'] = 24 * 3600  # How long /generate_report can find a result
+app.config['REPORT_WORKERS'] = 1
+app.config['REPORT_PRERENDER'] = True  # Render the PDF in the background as soon as analysis finishes
+app.config['REPORT_MAX_BACKLOG'] = 8  # Background renders queued at once; further reports are rendered on request
+app.config['REPORTS_MAX_FILES'] = 1000  # Rendered reports kept on disk
+app.config['UPLOAD_PERSIST'] = 'async'  # 'async', 'sync' or 'off'; analysis always runs from memory
+app.config['TILE_STRIDE'] = 112  # Overlap of the 224px tiles used by ?tiled=1
+app.config['TILE_BATCH_SIZE'] = 16
+app.config['TILE_MAX_TILES'] = 256  # Larger images are downscaled to stay within this many tiles (about 1.9x at 12MP; see effective_stride)
+app.config['HEATMAP_MAX_SIDE'] = 64  # Resolution of the heatmap returned in the JSON
+app.config['TRIAGE_DEFAULT'] = False  # Screen uploads cheaply and analyze in full only when suspicious; ?triage=0/1 overrides
+app.config['TRIAGE_THRESHOLD'] = 0.6  # Triage score (0-1) at which an image is escalated to the full analysis
+app.config['TRIAGE_CROP_SIZE'] = 512  # Native-resolution crop used by the triage DCT check
+app.config['TRIAGE_MAX_SIDE'] = 512  # Triage region statistics run on a copy this size
+app.config['PHASH_INDEX'] = True  # Record perceptual hashes to report near-duplicates of earlier uploads
+app.config['PHASH_INDEX_DB'] = os.path.join('cache', 'phash.db')
+app.config['PHASH_RADIUS'] = 6  # Max pHash Hamming distance (of 64 bits) for a near-duplicate
+app.config['PHASH_INDEX_MAX_ENTRIES'] = 5000000
+app.config['PHASH_REUSE_MAX_DISTANCE'] = None  # Reuse a near-duplicate's analysis within this distance; None always analyzes
+app.config['MEMORY_BUDGET_BYTES'] = 3 * 1024 * 1024 * 1024  # Estimated peak memory of the analyses running at once, per worker process
+app.config['MEMORY_MAX_REQUEST_BYTES'] = 1536 * 1024 * 1024  # Larger analyses are decoded at 1/2, 1/4 or 1/8 scale, or refused
+app.config['MEMORY_MAX_WAIT'] = 30  # Seconds an analysis queues for memory before a 503
+app.config['WARMUP_MODEL'] = True  # Run one forward pass before serving so the first request is not slow
+
+metrics.enabled = app.config['METRICS_ENABLED']
 
 # Ensure upload and reports directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['REPORTS_FOLDER'], exist_ok=True)
 
-# Store analysis results
-analysis_results = {}
+# Store analysis results by result id for report generation
+results_store = create_results_store(
+    app.config['RESULTS_STORE'],
+    path=app.config['RESULTS_DB'],
+    max_entries=app.config['RESULTS_MAX_ENTRIES'],
+    ttl=app.config['RESULTS_TTL']
+)
+
+# Admits analyses against the process's memory budget
+memory_governor = MemoryGovernor(
+    app.config['MEMORY_BUDGET_BYTES'],
+    max_request_bytes=app.config['MEMORY_MAX_REQUEST_BYTES'],
+    max_wait=app.config['MEMORY_MAX_WAIT']
+)
+
+# Renders and caches PDF reports by result id
+report_renderer = ReportRenderer(
+    app.config['REPORTS_FOLDER'],
+    workers=app.config['REPORT_WORKERS'],
+    max_reports=app.config['REPORTS_MAX_FILES'],
+    governor=memory_governor,
+    max_backlog=app.config['REPORT_MAX_BACKLOG']
+)
 
-# Load ML model
+# Results depend on the model variant as well as the analyzers
+analysis_key = f"{ANALYSIS_VERSION}-{app.config['MODEL_HEAD']}-{app.config['INFERENCE_BACKEND']}"
+
+# Cache analysis results by content hash so re-uploads skip the analyzers
+result_cache = ResultCache(
+    app.config['CACHE_FOLDER'],
+    max_memory_entries=app.config['CACHE_MEMORY_ENTRIES'],
+    max_disk_bytes=app.config['CACHE_MAX_DISK_BYTES'],
+    ttl=app.config['CACHE_TTL']
+)
+
+# Perceptual hashes of analyzed images, for near-duplicate lookups
+phash_index = None
+if app.config['PHASH_INDEX']:
+    phash_index = PerceptualHashIndex(
+        app.config['PHASH_INDEX_DB'],
+        radius=app.config['PHASH_RADIUS'],
+        max_entries=app.config['PHASH_INDEX_MAX_ENTRIES']
+    )
+
+# Load ML model (once in the gunicorn master with preload_app; workers share it copy-on-write)
+started = time.perf_counter()
 try:
-    model = load_model()
+    model = optimize_model(
+        load_model(app.config['MODEL_HEAD']),
+        backend=app.config['INFERENCE_BACKEND'],
+        channels_last=app.config['INFERENCE_CHANNELS_LAST'],
+        num_threads=app.config['INFERENCE_THREADS']
+    )
 except Exception as e:
     print(f"Error loading ML model: {str(e)}")
     model = None
+startup_timings['model_load'] = time.perf_counter() - started
 
-def analyze_metadata(image_path):
-    """Analyze image metadata"""
+# Pay for lazy kernel initialization before the first request does
+if model is not None and app.config['WARMUP_MODEL']:
+    started = time.perf_counter()
     try:
-        with open(image_path, 'rb') as image_file:
-            img = ExifImage(image_file)
-        
-        metadata = {
-            'has_exif': img.has_exif,
-            'make': img.get('make', ''),
-            'model': img.get('model', ''),
-            'datetime': img.get('datetime', ''),
-            'software': img.get('software', '')
-        }
-        return metadata
+        warmup_model(model)
+        startup_timings['warmup'] = time.perf_counter() - started
     except Exception as e:
-        return {'error': str(e)}
-
-def convert_numpy_types(obj):
-    """Convert NumPy types to Python native types for JSON serialization"""
-    if isinstance(obj, np.bool_):
-        return bool(obj)
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    return obj
+        # The first request pays for initialization instead
+        print(f"Error warming up ML model: {str(e)}")
+
+print('Startup: ' + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in startup_timings.items()))
+
+# Batch concurrent requests into shared forward passes
+inference_engine = None if model is None else InferenceEngine(
+    model,
+    max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+    max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+)
+
+# Writes uploads to disk off the request path
+upload_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-writer')
+
+# Runs the analysis stages of each request concurrently
+pipeline = PipelineExecutor(
+    max_workers=app.config['PIPELINE_WORKERS'],
+    use_processes=app.config['PIPELINE_USE_PROCESSES']
+)
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file part'}), 400
+def analysis_variant(mode, tiled, triage=False):
+    """Cache key suffix naming the analysis settings of a request"""
+    variant = f"{analysis_key}-{mode}-tiled" if tiled else f"{analysis_key}-{mode}"
+    if triage:
+        variant += f"-triage{app.config['TRIAGE_THRESHOLD']}"
+    return variant
+
+def wants_triage():
+    """Whether this request is screened by triage mode first"""
+    value = request.values.get('triage')
+    if value is None:
+        return app.config['TRIAGE_DEFAULT']
+    return value in ('1', 'true')
+
+def triage_settings(triage):
+    """Keyword arguments for triage_image, or None when triage is off"""
+    if not triage:
+        return None
+    return {
+        'threshold': app.config['TRIAGE_THRESHOLD'],
+        'crop_size': app.config['TRIAGE_CROP_SIZE'],
+        'max_side': app.config['TRIAGE_MAX_SIDE']
+    }
+
+def tiling_settings(tiled):
+    """Keyword arguments for tiled_heatmap, or None when tiling is off"""
+    if not tiled:
+        return None
+    return {
+        'stride': app.config['TILE_STRIDE'],
+        'batch_size': app.config['TILE_BATCH_SIZE'],
+        'max_tiles': app.config['TILE_MAX_TILES'],
+        'max_side': app.config['HEATMAP_MAX_SIDE']
+    }
+
+def persist_upload(data, filepath):
+    """Write an upload to the uploads folder unless an identical copy is already there"""
+    if os.path.exists(filepath):
+        return filepath
+    tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+    return filepath
+
+def read_upload(timings=None):
+    """Validate the uploaded image and read it into memory
+    
+    Returns (data, filepath, filename, mode, tiled, triage, cache_key), or (error_response, status).
+    `filepath` is where the upload is (being) persisted, or None when
+    UPLOAD_PERSIST is 'off'.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+    
+    # Copy-move detection trades accuracy for speed per request
+    mode = request.values.get('mode', 'accurate')
+    if mode not in COPY_MOVE_MODES:
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    
+    # Sliding-window inference adds a forgery heatmap at extra cost
+    tiled = request.values.get('tiled') in ('1', 'true')
+    triage = wants_triage()
+    
+    # Check the file type and hash it for the result cache in a single pass
+    with metrics.stage('read', timings):
+        data, digest, file_mime = read_image_stream(file.stream)
+    if data is None:
+        return jsonify({'error': 'File must be an image'}), 400
+    
+    cache_key = ResultCache.make_key(digest, analysis_variant(mode, tiled, triage))
+    
+    # Keep the upload under its result id so uploads with the same name do not overwrite each other
+    filename = secure_filename(file.filename)
+    filepath = None
+    persist = app.config['UPLOAD_PERSIST']
+    if persist != 'off':
+        extension = os.path.splitext(filename)[1].lower()
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], make_result_id(cache_key) + extension)
+        if persist == 'async':
+            upload_writer.submit(persist_upload, data, filepath)
+        else:
+            with metrics.stage('save', timings):
+                persist_upload(data, filepath)
+    return data, filepath, filename, mode, tiled, triage, cache_key
+
+class NearDuplicateLookup:
+    """run_analysis `reuse` hook that looks an upload up in the perceptual-hash index
+    
+    It runs once the memory governor has admitted the analysis and hashes
+    the (possibly reduced) grayscale view the analyzers share, so no extra
+    decode happens outside the budget. Afterwards `hashes` holds the
+    upload's hashes and `match` is {'result_id', 'distance',
+    'dhash_distance', 'reused'} or None. The match's cached analysis for
+    `variant` is returned for reuse when it is within
+    PHASH_REUSE_MAX_DISTANCE; it must not be cached under `digest`, which
+    would serve it later as an exact match.
+    """
+
+    def __init__(self, digest, variant, timings=None):
+        self.digest = digest
+        self.variant = variant
+        self.timings = timings
+        self.hashes = None
+        self.match = None
+
+    def __call__(self, context):
+        with metrics.stage('phash', self.timings):
+            self.hashes = gray_hashes(context.gray)
+            match = phash_index.find(self.hashes, exclude_digest=self.digest)
+        if match is None:
+            return None
         
-        file = request.files['file']
+        analysis = None
+        max_distance = app.config['PHASH_REUSE_MAX_DISTANCE']
+        if max_distance is not None and match['distance'] <= max_distance:
+            analysis = result_cache.get(ResultCache.make_key(match['digest'], self.variant))
+        self.match = {key: match[key] for key in ('result_id', 'distance', 'dhash_distance')}
+        self.match['reused'] = analysis is not None
+        metrics.increment('near_duplicates_total', reused=str(self.match['reused']).lower())
+        return analysis
+
+def store_analysis(cache_key, analysis, lookup):
+    """Cache a new analysis and index the upload's perceptual hashes"""
+    if lookup is None or lookup.match is None or not lookup.match['reused']:
+        result_cache.put(cache_key, analysis)
+    if lookup is not None and lookup.hashes is not None:
+        phash_index.add(cache_key.split('-', 1)[0], lookup.hashes, make_result_id(cache_key))
+
+def analyze_upload(data, filepath, filename, mode, tiled, triage, cache_key, timings=None):
+    """Analyze an upload held in memory, going through the result cache
+    
+    New uploads are also looked up in the perceptual-hash index; a match is
+    returned as 'near_duplicate_of'. Returns the stored results, or
+    {'error': message, 'status': http_status}.
+    """
+    with metrics.stage('cache_lookup', timings):
+        analysis = result_cache.get(cache_key)
+    cached = analysis is not None
+    metrics.increment('cache_lookups_total', result='hit' if cached else 'miss')
+    near_duplicate_of = None
+    if not cached:
+        digest, variant = cache_key.split('-', 1)
+        lookup = None if phash_index is None else NearDuplicateLookup(digest, variant, timings)
+        analysis = run_analysis(
+            data, pipeline, inference_engine, mode, timings, tiling_settings(tiled), digest, triage_settings(triage),
+            memory_governor, lookup
+        )
+        if 'error' in analysis:
+            return analysis
+        near_duplicate_of = None if lookup is None else lookup.match
+        store_analysis(cache_key, analysis, lookup)
+    
+    # Store results
+    results = {
+        'result_id': make_result_id(cache_key),
+        'filename': filename,
+        'image_file': os.path.basename(filepath) if filepath else None,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'cached': cached,
+        **analysis
+    }
+    if near_duplicate_of is not None:
+        results['near_duplicate_of'] = near_duplicate_of
+    results_store.put(results['result_id'], results)
+    if app.config['REPORT_PRERENDER']:
+        # Queue the persisted upload, not its bytes. The single upload writer runs the
+        # prerender after this upload's own write, so the renderer finds the file.
+        if app.config['UPLOAD_PERSIST'] == 'async':
+            upload_writer.submit(report_renderer.prerender, results['result_id'], filepath, results)
+        else:
+            report_renderer.prerender(results['result_id'], filepath or '', results)
+    return results
+
+# Background workers for the asynchronous job API
+job_queue = JobQueue(
+    analyze_upload,
+    workers=app.config['JOB_WORKERS'],
+    max_queue_size=app.config['JOB_QUEUE_SIZE'],
+    max_finished_jobs=app.config['JOB_RETENTION'],
+    records=create_job_records(app.config['JOB_STORE'], app.config['JOB_DB'], app.config['JOB_RETENTION'])
+)
+
+# Analyzes the images of /batch requests in parallel
+batch_executor = ThreadPoolExecutor(max_workers=app.config['BATCH_WORKERS'], thread_name_prefix='batch')
+
+def iter_batch_files(files):
+    """Yield (name, data) for each uploaded file, unpacking ZIP archives member by member"""
+    for file in files:
         if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
+            continue
+        if not zipfile.is_zipfile(file.stream):
+            file.stream.seek(0)
+            yield secure_filename(file.filename), file.read()
+            continue
         
-        # Check file type
-        mime = magic.Magic(mime=True)
-        file_mime = mime.from_buffer(file.read(1024))
-        file.seek(0)  # Reset file pointer
-        
-        if not file_mime.startswith('image/'):
-            return jsonify({'error': 'File must be an image'}), 400
+        # Read one member at a time from the spooled upload instead of extracting the archive
+        file.stream.seek(0)
+        with zipfile.ZipFile(file.stream) as archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                if member.is_dir() or not name or name.startswith('.') or member.filename.startswith('__MACOSX/'):
+                    continue
+                if member.file_size > app.config['MAX_CONTENT_LENGTH']:
+                    yield name, None
+                    continue
+                yield name, archive.read(member)
+
+def analyze_batch_item(name, data, mode, tiled=False, triage=False):
+    """Analyze one image of a batch; return its NDJSON result line"""
+    if data is None:
+        return {'name': name, 'error': 'File is too large'}
+    
+    if not sniff_mime(data).startswith('image/'):
+        return {'name': name, 'error': 'File must be an image'}
+    
+    digest = content_hash(data)
+    variant = analysis_variant(mode, tiled, triage)
+    cache_key = ResultCache.make_key(digest, variant)
+    analysis = result_cache.get(cache_key)
+    cached = analysis is not None
+    near_duplicate_of = None
+    if not cached:
+        lookup = None if phash_index is None else NearDuplicateLookup(digest, variant)
+        analysis = run_analysis(
+            data, pipeline, inference_engine, mode,
+            tiling=tiling_settings(tiled), digest=digest, triage=triage_settings(triage),
+            governor=memory_governor, reuse=lookup
+        )
+        if 'error' in analysis:
+            return {'name': name, 'error': analysis['error']}
+        near_duplicate_of = None if lookup is None else lookup.match
+        store_analysis(cache_key, analysis, lookup)
+    
+    # Batch images are not kept on disk, so their reports carry no picture
+    results = {
+        'result_id': make_result_id(cache_key),
+        'filename': name,
+        'image_file': None,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'cached': cached,
+        **analysis
+    }
+    if near_duplicate_of is not None:
+        results['near_duplicate_of'] = near_duplicate_of
+    # Keep an existing record of the same upload; it may point at a saved image
+    if results_store.get(results['result_id']) is None:
+        results_store.put(results['result_id'], results)
+    return {'name': name, **results}
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    try:
+        # ?timings=1 adds per-stage durations (ms) to the response
+        timings = {} if request.values.get('timings') in ('1', 'true') else None
+        with metrics.stage('upload_total', timings):
+            upload = read_upload(timings)
+            if len(upload) == 2:
+                return upload
+            
+            results = analyze_upload(*upload, timings=timings)
+        if 'error' in results:
+            return jsonify({'error': results['error']}), results['status']
         
-        # Ensure upload directory exists
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        # Return results
+        if timings is not None:
+            return jsonify({**results, 'timings': timings})
+        return jsonify(results)
         
-        # Save file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    except Exception as e:
+        metrics.increment('errors_total', stage='server')
+        app.logger.error(f"Error processing file: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/batch', methods=['POST'])
+def upload_batch():
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    mode = request.values.get('mode', 'accurate')
+    if mode not in COPY_MOVE_MODES:
+        return jsonify({'error': f'Unknown mode: {mode}'}), 400
+    tiled = request.values.get('tiled') in ('1', 'true')
+    triage = wants_triage()
+    
+    def generate():
+        started = time.perf_counter()
+        summary = {'total': 0, 'succeeded': 0, 'failed': 0, 'cached': 0}
+        pending = set()
         
-        # Analyze metadata
-        metadata = analyze_metadata(filepath)
-        if isinstance(metadata, dict) and 'error' in metadata:
-            return jsonify({'error': f'Metadata analysis failed: {metadata["error"]}'}), 500
+        def finished(futures):
+            for future in futures:
+                try:
+                    line = future.result()
+                except Exception as e:
+                    line = {'name': future.name, 'error': f'Server error: {str(e)}'}
+                summary['total'] += 1
+                if 'error' in line:
+                    summary['failed'] += 1
+                else:
+                    summary['succeeded'] += 1
+                    summary['cached'] += int(line['cached'])
+                yield json.dumps(line) + '\n'
         
-        # Detect forgery using ML
-        forgery_detection = {'error': 'ML model not loaded'} if model is None else detect_forgery_ml(filepath, model)
-        if isinstance(forgery_detection, dict) and 'error' in forgery_detection:
-            return jsonify({'error': f'Forgery detection failed: {forgery_detection["error"]}'}), 500
+        try:
+            for name, data in iter_batch_files(files):
+                # Bound the number of decoded members held in memory at once
+                if len(pending) >= app.config['BATCH_MAX_IN_FLIGHT']:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from finished(done)
+                future = batch_executor.submit(analyze_batch_item, name, data, mode, tiled, triage)
+                future.name = name
+                pending.add(future)
+        except zipfile.BadZipFile as e:
+            summary['error'] = f'Invalid ZIP archive: {str(e)}'
         
-        # Analyze image regions
-        region_analysis = analyze_image_regions(filepath)
-        if isinstance(region_analysis, dict) and 'error' in region_analysis:
-            return jsonify({'error': f'Region analysis failed: {region_analysis["error"]}'}), 500
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
         
-        # Store results
-        results = {
-            'filename': filename,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'metadata': metadata,
-            'forgery_detection': forgery_detection,
-            'region_analysis': region_analysis
-        }
+        summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        yield json.dumps({'summary': summary}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        upload = read_upload()
+        if len(upload) == 2:
+            return upload
         
-        # Convert NumPy types to Python native types
-        results = convert_numpy_types(results)
-        analysis_results[filename] = results
+        job = job_queue.submit(*upload)
+        if job is None:
+            response = jsonify({'error': 'Job queue is full, retry later'})
+            response.headers['Retry-After'] = str(job_queue.retry_after())
+            return response, 429
         
-        # Return results
-        return jsonify(results)
+        return jsonify({'job_id': job['id'], 'status': job['status']}), 202
         
     except Exception as e:
-        app.logger.error(f"Error processing file: {str(e)}\n{traceback.format_exc()}")
+        app.logger.error(f"Error submitting job: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-@app.route('/generate_report/<filename>')
-def generate_pdf_report(filename):
+@app.route('/jobs/stats')
+def job_stats():
+    return jsonify(job_queue.get_stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    response = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'queue_wait_seconds': None if job['started_at'] is None else job['started_at'] - job['submitted_at']
+    }
+    if job['status'] == 'done':
+        response['result'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/generate_report/<result_id>')
+def generate_pdf_report(result_id):
     try:
-        if filename not in analysis_results:
+        results = results_store.get(result_id)
+        if results is None:
             return jsonify({'error': 'Analysis results not found for this image'}), 404
         
-        # Generate report filename
-        report_filename = f"report_{filename.rsplit('.', 1)[0]}.pdf"
-        report_path = os.path.join(app.config['REPORTS_FOLDER'], report_filename)
-        
         # Get image path
-        image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        image_path = os.path.join(app.config['UPLOAD_FOLDER'], results['image_file']) if results['image_file'] else ''
         
-        # Generate PDF report
-        generate_report(image_path, analysis_results[filename], report_path)
+        # Reuse the stored report, waiting for a background render if one is running
+        report_path = report_renderer.get(result_id, image_path, results)
         
         # Return the PDF file
         return send_from_directory(
             app.config['REPORTS_FOLDER'],
-            report_filename,
+            os.path.basename(report_path),
             as_attachment=True,
-            download_name=report_filename
+            download_name=f"report_{results['filename'].rsplit('.', 1)[0]}.pdf"
         )
         
     except Exception as e:
         app.logger.error(f"Error generating report: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': f'Error generating report: {str(e)}'}), 500
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.get_stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    gauges = {f'cache_{key}': value for key, value in result_cache.get_stats().items()}
+    gauges.update({f'jobs_{key}': value for key, value in job_queue.get_stats().items()})
+    gauges.update({f'results_{key}': value for key, value in results_store.get_stats().items()})
+    gauges.update({f'metadata_cache_{key}': value for key, value in metadata_cache.get_stats().items()})
+    if phash_index is not None:
+        gauges.update({f'phash_{key}': value for key, value in phash_index.get_stats().items()})
+    gauges.update({f'memory_{key}': value for key, value in memory_governor.get_stats().items()})
+    gauges.update({f'reports_{key}': value for key, value in report_renderer.get_stats().items()})
+    gauges.update({f'startup_{name}_seconds': seconds for name, seconds in startup_timings.items()})
+    if inference_engine is not None:
+        gauges.update({f'inference_{key}': value for key, value in inference_engine.stats.items()})
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
@@ -0,0 +1,119 @@
+"""Measure detection accuracy over a labelled corpus from generate_sample_images.py.
+
+Every image in the manifest is analyzed and its verdict compared with the
+ground truth. An image counts as flagged when the web UI would recommend a
+closer look: compression artifacts, suspicious regions, an ML confidence
+above 0.7 or missing EXIF data. The report breaks the flag rate down by
+manipulation and by signal, and for copy-move images also checks whether a
+reported region pair overlaps the cloned squares.
+
+Usage:
+    python benchmarks/accuracy.py corpus/manifest.jsonl --limit 500 --mode fast
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import run_analysis
+from copy_move import COPY_MOVE_MODES
+from generate_sample_images import load_manifest
+from ml_detection import MODEL_HEADS, load_model
+
+SIGNALS = ('compression_artifacts', 'suspicious_regions', 'ml_confidence', 'no_exif')
+
+def signals(analysis, ml_threshold=0.7):
+    """Which of the UI's warning signs an analysis shows"""
+    forgery = analysis['forgery_detection']
+    return {
+        'compression_artifacts': bool(forgery['compression_artifacts']),
+        'suspicious_regions': bool(forgery['suspicious_regions']),
+        'ml_confidence': (forgery['ml_confidence'] or 0) > ml_threshold,
+        'no_exif': not analysis['metadata'].get('has_exif', False)
+    }
+
+def _overlaps(a, b):
+    return (a['x'] < b['x'] + b['width'] and b['x'] < a['x'] + a['width'] and
+            a['y'] < b['y'] + b['height'] and b['y'] < a['y'] + a['height'])
+
+def localized(analysis, regions):
+    """Whether any reported copy-move region overlaps a ground-truth region"""
+    pairs = analysis['forgery_detection']['analysis_details']['copy_move']['region_pairs']
+    boxes = [pair[key] for pair in pairs for key in ('source', 'target')]
+    return any(_overlaps(box, region) for box in boxes for region in regions)
+
+def evaluate(records, model, mode='accurate', triage=None):
+    """Analyze each record; return per-group counts keyed by manipulation ('authentic' for originals)"""
+    groups = defaultdict(lambda: defaultdict(int))
+    started = time.monotonic()
+    for done, record in enumerate(records, 1):
+        group = groups[record['manipulation'] or 'authentic']
+        group['images'] += 1
+        analysis = run_analysis(record['path'], None, model, mode, triage=triage)
+        if 'error' in analysis:
+            group['errors'] += 1
+            continue
+        found = signals(analysis)
+        group['flagged'] += any(found.values())
+        for name, value in found.items():
+            group[name] += value
+        group[f"tier_{analysis.get('tier', 'full')}"] += 1
+        if record['manipulation'] == 'copy_move':
+            group['localized'] += localized(analysis, record['regions'])
+        rate = done / max(time.monotonic() - started, 1e-9)
+        sys.stderr.write(f"\r{done}/{len(records)} images  {rate:.2f} images/s  ")
+        sys.stderr.flush()
+    sys.stderr.write('\n')
+    return {name: dict(counts) for name, counts in groups.items()}
+
+def print_report(groups):
+    print(f"{'group':14} {'images':>7} {'flagged':>8} " + ' '.join(f"{name:>22}" for name in SIGNALS) + f" {'localized':>10}")
+    for name in sorted(groups):
+        counts = groups[name]
+        analyzed = max(counts['images'] - counts.get('errors', 0), 1)
+        cells = ' '.join(f"{counts.get(signal, 0) / analyzed:22.1%}" for signal in SIGNALS)
+        localized_rate = f"{counts['localized'] / analyzed:10.1%}" if 'localized' in counts else f"{'-':>10}"
+        print(f"{name:14} {counts['images']:7d} {counts.get('flagged', 0) / analyzed:8.1%} {cells} {localized_rate}")
+
+    authentic = groups.get('authentic', {})
+    manipulated = [counts for name, counts in groups.items() if name != 'authentic']
+    true_positives = sum(counts.get('flagged', 0) for counts in manipulated)
+    positives = sum(counts['images'] - counts.get('errors', 0) for counts in manipulated)
+    false_positives = authentic.get('flagged', 0)
+    negatives = authentic.get('images', 0) - authentic.get('errors', 0)
+    if positives:
+        print(f"\nDetection rate {true_positives / positives:.1%} of {positives} manipulated images")
+    if negatives:
+        print(f"False positive rate {false_positives / negatives:.1%} of {negatives} authentic images")
+    tiers = defaultdict(int)
+    for counts in groups.values():
+        for key, value in counts.items():
+            if key.startswith('tier_'):
+                tiers[key[len('tier_'):]] += value
+    print('Tiers: ' + ', '.join(f"{tier} {count}" for tier, count in sorted(tiers.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='manifest.jsonl written by generate_sample_images.py --count')
+    parser.add_argument('--limit', type=int, help='Only evaluate the first N images')
+    parser.add_argument('--mode', choices=sorted(COPY_MOVE_MODES), default='accurate')
+    parser.add_argument('--head', choices=sorted(MODEL_HEADS), default='flatten')
+    parser.add_argument('--triage', action='store_true', help='Screen with triage mode first')
+    parser.add_argument('--triage-threshold', type=float, default=0.6)
+    parser.add_argument('--output', help='Write the per-group counts to this JSON file')
+    args = parser.parse_args()
+
+    records = load_manifest(args.manifest)[:args.limit]
+    triage = {'threshold': args.triage_threshold} if args.triage else None
+    groups = evaluate(records, load_model(args.head), args.mode, triage)
+    print_report(groups)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(groups, output, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
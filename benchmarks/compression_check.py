@@ -0,0 +1,76 @@
+"""Check that the JPEG compression test does not flag single-compressed images.
+
+Authentic images from generate_sample_images.py are saved once at each of
+`--qualities` and must come out without compression artifacts; the same
+images saved at `--first-qualities` and then again at `--final-quality`
+(on the same grid, see generate_sample_images.recompress) show the
+detection rate. When the first step of a frequency is a multiple of the
+final one, double quantization leaves no trace in that frequency, so
+pairs where that holds for most frequencies (50/90, 60/90, 80/95) are
+expected to go largely undetected. Exits with status 1 if any
+single-compressed image is flagged.
+
+Usage:
+    python benchmarks/compression_check.py --images 6 --width 1024 --height 768
+"""
+import argparse
+import os
+import sys
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generate_sample_images import authentic_image, encode_jpeg, recompress
+from ml_detection import analyze_compression
+
+def _flagged(data):
+    """Whether analyze_compression reports artifacts for encoded JPEG bytes"""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return analyze_compression(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))['compression_artifacts']
+
+def check(images, width, height, qualities, first_qualities, final_quality, seed=0):
+    """Return ({quality: flagged singles}, {first quality: flagged doubles})"""
+    single = defaultdict(int)
+    double = defaultdict(int)
+    for index in range(images):
+        rng = np.random.default_rng([seed, index])
+        image = authentic_image(width, height, rng)
+        for quality in qualities:
+            single[quality] += _flagged(encode_jpeg(image, quality))
+        for first_quality in first_qualities:
+            resaved = image.copy()
+            recompress(resaved, rng, first_quality=first_quality, shift=0)
+            double[first_quality] += _flagged(encode_jpeg(resaved, final_quality))
+        sys.stderr.write(f"\r{index + 1}/{images} images  ")
+        sys.stderr.flush()
+    sys.stderr.write('\n')
+    return dict(single), dict(double)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=6)
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--height', type=int, default=768)
+    parser.add_argument('--qualities', type=int, nargs='+', default=[60, 75, 85, 90, 95])
+    parser.add_argument('--first-qualities', type=int, nargs='+', default=[50, 60, 70, 75, 80])
+    parser.add_argument('--final-quality', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    single, double = check(args.images, args.width, args.height, args.qualities,
+                           args.first_qualities, args.final_quality, args.seed)
+    print(f"{'compression':>14} {'flagged':>8}")
+    for quality in args.qualities:
+        print(f"{f'q{quality}':>14} {single[quality]:5d}/{args.images}")
+    for first_quality in args.first_qualities:
+        print(f"{f'q{first_quality}->q{args.final_quality}':>14} {double[first_quality]:5d}/{args.images}")
+    false_positives = sum(single.values())
+    if false_positives:
+        print(f"\n{false_positives} single-compressed images flagged")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Compare the CPU inference backends of ForgeryDetector.
+
+Each configuration runs in a fresh process so its resident memory is
+measured on its own. Drift is the largest absolute difference in forgery
+probability between the optimized model and the eager model it was built
+from, over the benchmark inputs.
+
+Usage:
+    python benchmarks/inference_backends.py --threads 4 --batch-size 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ml_detection import INFERENCE_BACKENDS, MODEL_HEADS, load_model, optimize_model
+
+def rss_mb():
+    """Current and peak resident set size of this process in MB"""
+    values = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0]) / 1024
+    return values.get('VmRSS', 0.0), values.get('VmHWM', 0.0)
+
+def probabilities(model, inputs):
+    with torch.no_grad():
+        return torch.softmax(model(inputs), dim=1)[:, 1].numpy()
+
+def measure(config, args, results):
+    """Benchmark one (head, backend, channels_last) configuration in this process"""
+    head, backend, channels_last = config
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    reference = load_model(head)
+    inputs = torch.randn(args.batch_size, 3, 224, 224)
+    expected = probabilities(reference, inputs)
+    model = optimize_model(reference, backend=backend, channels_last=channels_last)
+    # Drop the eager weights when the backend made a copy so RSS reflects the served model
+    del reference
+    single = inputs[:1]
+    for _ in range(args.warmup):
+        probabilities(model, single)
+        probabilities(model, inputs)
+    drift = float(np.abs(probabilities(model, inputs) - expected).max())
+
+    latencies = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        probabilities(model, single)
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        probabilities(model, inputs)
+    throughput = args.iterations * args.batch_size / (time.perf_counter() - start)
+
+    rss, peak_rss = rss_mb()
+    results.put({
+        'config': config,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'throughput': throughput,
+        'rss_mb': rss,
+        'peak_rss_mb': peak_rss,
+        'drift': drift
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--heads', nargs='+', choices=sorted(MODEL_HEADS), default=sorted(MODEL_HEADS))
+    parser.add_argument('--backends', nargs='+', choices=INFERENCE_BACKENDS, default=list(INFERENCE_BACKENDS))
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    args = parser.parse_args()
+
+    configs = [
+        (head, backend, channels_last)
+        for head in args.heads
+        for backend in args.backends
+        for channels_last in (False, True)
+    ]
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    print(f"threads: {args.threads}, batch size: {args.batch_size}, iterations: {args.iterations}")
+    print(f"{'head':8} {'backend':12} {'chlast':6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'img/s':>8} {'RSS MB':>8} {'peak MB':>8} {'drift':>9}")
+    for config in configs:
+        process = context.Process(target=measure, args=(config, args, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{config[0]:8} {config[1]:12} {str(config[2]):6} failed (exit code {process.exitcode})")
+            continue
+        row = results.get()
+        print(f"{config[0]:8} {config[1]:12} {str(config[2]):6} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} "
+              f"{row['throughput']:8.1f} {row['rss_mb']:8.0f} {row['peak_rss_mb']:8.0f} {row['drift']:9.2e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compare per-request inference against the micro-batching InferenceEngine.
+
+Usage:
+    python benchmarks/inference_batching.py --requests 256 --concurrency 16
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inference_engine import InferenceEngine
+from ml_detection import load_model, predict_forgery_probability
+
+def run(predict, tensors, concurrency):
+    """Push every tensor through `predict` from `concurrency` threads; return images/sec"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(predict, tensors))
+    return len(tensors) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=256)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = load_model()
+    torch.manual_seed(0)
+    tensors = [torch.randn(1, 3, 224, 224) for _ in range(args.requests)]
+
+    # Warm up both paths so one-off allocations are not measured
+    predict_forgery_probability(tensors[0], model)
+
+    per_request = run(lambda t: predict_forgery_probability(t, model), tensors, args.concurrency)
+
+    engine = InferenceEngine(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    engine.predict(tensors[0])
+    engine.stats = {'batches': 0, 'images': 0}
+    batched = run(engine.predict, tensors, args.concurrency)
+    engine.close()
+
+    print(f"Requests: {args.requests}, concurrency: {args.concurrency}")
+    print(f"Per-request path: {per_request:8.2f} images/sec")
+    print(f"Batched engine:   {batched:8.2f} images/sec "
+          f"(mean batch size {engine.stats['images'] / max(engine.stats['batches'], 1):.2f})")
+    print(f"Speedup: {batched / per_request:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Time each stage of the analysis pipeline over a synthetic image corpus.
+
+The corpus is generated deterministically from `--seed` at several
+resolutions and in JPEG, PNG and WebP, and reused on later runs; with
+`--manifest` the authentic images of a generate_sample_images.py corpus
+are used instead, one per resolution. Every
+image goes through the stages in order (decode, DCT, SIFT, contours,
+preprocess, inference, EXIF, PDF) `--repeats` times. For each stage,
+format and size the suite records p50/p95 latency, throughput and peak
+RSS (VmHWM, reset through /proc/self/clear_refs before each stage).
+
+Usage:
+    python benchmarks/suite.py --output benchmarks/baseline.json
+    python benchmarks/suite.py --compare benchmarks/baseline.json --threshold 0.15
+    python benchmarks/suite.py --manifest corpus/manifest.jsonl
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import analyze_metadata
+from generate_sample_images import load_manifest
+from image_context import ImageContext
+from ml_detection import (
+    analyze_cloning,
+    analyze_compression,
+    analyze_region_statistics,
+    load_model,
+    predict_forgery_probability,
+    preprocess_image,
+)
+from report_generator import generate_report
+
+STAGES = ('decode', 'dct', 'sift', 'contours', 'preprocess', 'inference', 'exif', 'pdf')
+FORMATS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp'}
+DEFAULT_SIZES = (0.3, 2, 12, 50)
+
+def synthetic_image(megapixels, rng):
+    """Camera-like BGR image: smooth shading, mid-frequency texture and sensor noise, 4:3"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(width * 3 / 4))
+    image = np.zeros((height, width, 3), dtype=np.float32)
+    for cells, amplitude in ((4, 90.0), (32, 35.0), (256, 15.0)):
+        coarse = rng.standard_normal((cells * 3 // 4 + 1, cells + 1, 3)).astype(np.float32)
+        image += amplitude * cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    image += rng.normal(0, 4, (height, width, 3)).astype(np.float32)
+    image += 128
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def build_corpus(directory, sizes, formats, seed):
+    """Write the corpus images that do not exist yet; return {(format, size): path}"""
+    os.makedirs(directory, exist_ok=True)
+    corpus = {}
+    for index, megapixels in enumerate(sizes):
+        image = None
+        for fmt in formats:
+            path = os.path.join(directory, f"seed{seed}_{megapixels}mp{FORMATS[fmt]}")
+            corpus[(fmt, megapixels)] = path
+            if os.path.exists(path):
+                continue
+            if image is None:
+                image = synthetic_image(megapixels, np.random.default_rng(seed + index))
+            if fmt == 'jpeg':
+                # Write camera EXIF so the metadata stage parses a real APP1 segment
+                pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                exif = pil_image.getexif()
+                exif[0x010F] = 'Benchmark Camera'  # Make
+                exif[0x0110] = 'Synthetic'         # Model
+                exif[0x0132] = '2024:01:01 12:00:00'  # DateTime
+                pil_image.save(path, quality=90, exif=exif)
+            elif fmt == 'png':
+                cv2.imwrite(path, image, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+            else:
+                cv2.imwrite(path, image, [cv2.IMWRITE_WEBP_QUALITY, 90])
+    return corpus
+
+def corpus_from_manifest(path):
+    """{('jpeg', megapixels): path} with the first authentic image of each resolution in a manifest"""
+    corpus = {}
+    for record in load_manifest(path):
+        if record['label'] != 'authentic':
+            continue
+        corpus.setdefault(('jpeg', round(record['width'] * record['height'] / 1e6, 1)), record['path'])
+    if not corpus:
+        raise ValueError(f'No authentic images in {path}')
+    return corpus
+
+def _read_status(key):
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(key + ':'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS; returns False where the kernel does not support it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+def run_stages(path, model, report_path):
+    """Run every stage once on `path`; return {stage: (seconds, peak_rss_mb, stage_peak_mb)}
+
+    `stage_peak_mb` is how far the stage pushed the high-water mark above
+    the RSS it started with, i.e. the memory the stage itself needed.
+    """
+    measurements = {}
+
+    def timed(stage, func):
+        reset_peak_rss()
+        before = _read_status('VmRSS')
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+        peak = _read_status('VmHWM')
+        measurements[stage] = (seconds, peak, max(peak - before, 0.0))
+        return value
+
+    def decode():
+        image = ImageContext.from_path(path)
+        image.gray  # Every classical analyzer starts from the grayscale view
+        return image
+
+    image = timed('decode', decode)
+    compression = timed('dct', lambda: analyze_compression(image.gray))
+    cloning = timed('sift', lambda: analyze_cloning(image.gray, 'accurate'))
+    regions = timed('contours', lambda: analyze_region_statistics(image.gray))
+    tensor = timed('preprocess', lambda: preprocess_image(image))
+    probability = timed('inference', lambda: predict_forgery_probability(tensor, model))
+    metadata = timed('exif', lambda: analyze_metadata(path))
+    results = {
+        'metadata': metadata,
+        'forgery_detection': {
+            'ml_confidence': probability,
+            'compression_artifacts': compression['compression_artifacts'],
+            'suspicious_regions': cloning['suspicious_regions'],
+            'analysis_details': {**compression, **cloning, 'ml_probability': probability}
+        },
+        'region_analysis': regions
+    }
+    timed('pdf', lambda: generate_report(path, results, report_path))
+    return measurements
+
+def summarize(seconds, peaks, stage_peaks, megapixels):
+    seconds = np.array(seconds)
+    p50 = float(np.percentile(seconds, 50))
+    return {
+        'p50_ms': p50 * 1000,
+        'p95_ms': float(np.percentile(seconds, 95)) * 1000,
+        'throughput_per_s': 1 / p50 if p50 > 0 else 0.0,
+        'megapixels_per_s': megapixels / p50 if p50 > 0 else 0.0,
+        'peak_rss_mb': float(max(peaks)),
+        'stage_peak_mb': float(max(stage_peaks)),
+        'samples': len(seconds)
+    }
+
+def run_suite(args):
+    if args.manifest:
+        corpus = corpus_from_manifest(args.manifest)
+    else:
+        corpus = build_corpus(args.corpus, args.sizes, args.formats, args.seed)
+    model = load_model()
+    if not reset_peak_rss():
+        print('warning: /proc/self/clear_refs is unavailable, peak RSS is the process high-water mark', file=sys.stderr)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        report_path = os.path.join(scratch, 'report.pdf')
+        # Warm up lazy initialization (model kernels, reportlab fonts) outside the measurements
+        run_stages(corpus[min(corpus, key=lambda key: key[1])], model, report_path)
+        for (fmt, megapixels), path in sorted(corpus.items()):
+            samples = {stage: ([], [], []) for stage in STAGES}
+            for _ in range(args.repeats):
+                for stage, measurement in run_stages(path, model, report_path).items():
+                    for values, value in zip(samples[stage], measurement):
+                        values.append(value)
+            for stage in STAGES:
+                key = f"{stage}/{fmt}/{megapixels}mp"
+                results[key] = summarize(*samples[stage], megapixels)
+                row = results[key]
+                print(f"{key:28} p50 {row['p50_ms']:9.1f} ms  p95 {row['p95_ms']:9.1f} ms  "
+                      f"{row['megapixels_per_s']:8.2f} MP/s  peak {row['peak_rss_mb']:7.0f} MB (+{row['stage_peak_mb']:.0f})",
+                      file=sys.stderr)
+
+    return {
+        'meta': {
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'torch': torch.__version__,
+            'seed': args.seed,
+            'repeats': args.repeats
+        },
+        'results': results
+    }
+
+def compare(current, baseline, threshold):
+    """Print the change of every shared measurement; return the regressed keys"""
+    regressions = []
+    for key in sorted(set(current['results']) & set(baseline['results'])):
+        now, before = current['results'][key], baseline['results'][key]
+        flags = []
+        for metric in ('p50_ms', 'p95_ms', 'peak_rss_mb'):
+            # Missing from baselines written before the metric existed
+            if metric not in before:
+                continue
+            if before[metric] > 0 and now[metric] > before[metric] * (1 + threshold):
+                flags.append(metric)
+        change = now['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] > 0 else 0.0
+        status = 'REGRESSION ' + ','.join(flags) if flags else 'ok'
+        peak_before = before.get('peak_rss_mb')
+        peak_before = 'n/a' if peak_before is None else f"{peak_before:.0f}"
+        print(f"{key:28} {before['p50_ms']:9.1f} -> {now['p50_ms']:9.1f} ms ({change:+6.1%})  "
+              f"peak {peak_before:>6} -> {now['peak_rss_mb']:6.0f} MB  {status}")
+        if flags:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'forgery-benchmark-corpus'))
+    parser.add_argument('--sizes', nargs='+', type=float, default=list(DEFAULT_SIZES), help='Megapixels')
+    parser.add_argument('--formats', nargs='+', choices=sorted(FORMATS), default=sorted(FORMATS))
+    parser.add_argument('--manifest', help='Benchmark a generate_sample_images.py corpus instead of the synthetic one')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare against a stored baseline JSON')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed relative slowdown before flagging')
+    args = parser.parse_args()
+
+    current = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(current, output, indent=2, sort_keys=True)
+        print(f"Wrote {len(current['results'])} measurements to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+        print('No regressions')
+
+if __name__ == '__main__':
+    main()
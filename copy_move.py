@@ -0,0 +1,147 @@
+import cv2
+import numpy as np
+
+# Per-request speed/accuracy trade-offs for copy-move detection
+COPY_MOVE_MODES = {
+    'accurate': {'detector': 'sift', 'max_side': 2048, 'max_keypoints': 4000, 'ratio': 0.6},
+    'fast': {'detector': 'orb', 'max_side': 1024, 'max_keypoints': 2000, 'ratio': 0.75},
+    # Screening pass of triage mode (see triage.py)
+    'triage': {'detector': 'orb', 'max_side': 512, 'max_keypoints': 1000, 'ratio': 0.75},
+}
+
+FLANN_INDEX_KDTREE = 1
+FLANN_INDEX_LSH = 6
+
+def _pyramid_level(gray, max_side):
+    """Halve the image with pyrDown until its longer side fits `max_side`; return (image, scale)"""
+    scale = 1
+    while max(gray.shape[:2]) > max_side:
+        gray = cv2.pyrDown(gray)
+        scale *= 2
+    return gray, scale
+
+def _create_detector(detector, max_keypoints):
+    if detector == 'orb':
+        return cv2.ORB_create(nfeatures=max_keypoints)
+    return cv2.SIFT_create(nfeatures=max_keypoints)
+
+def _create_matcher(detector):
+    if detector == 'orb':
+        index_params = dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1)
+    else:
+        index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=4)
+    return cv2.FlannBasedMatcher(index_params, dict(checks=32))
+
+def _self_matches(descriptors, matcher, ratio):
+    """Match descriptors against themselves; return (query, train) index pairs passing the ratio test"""
+    queries = []
+    trains = []
+    for neighbours in matcher.knnMatch(descriptors, descriptors, k=3):
+        # Drop the trivial self match, then apply Lowe's ratio test to the next two
+        neighbours = [m for m in neighbours if m.trainIdx != m.queryIdx]
+        if len(neighbours) < 2 or neighbours[0].distance >= ratio * neighbours[1].distance:
+            continue
+        queries.append(neighbours[0].queryIdx)
+        trains.append(neighbours[0].trainIdx)
+    return np.array(queries, dtype=np.int64), np.array(trains, dtype=np.int64)
+
+def _bounding_box(points, scale):
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return {
+        'x': int(x0 * scale),
+        'y': int(y0 * scale),
+        'width': int(max(x1 - x0, 1) * scale),
+        'height': int(max(y1 - y0, 1) * scale)
+    }
+
+def detect_copy_move(gray, mode='accurate', min_distance=16, bin_size=8, min_cluster_size=4, max_region_pairs=10):
+    """Find regions of a grayscale image that were copied elsewhere in the same image
+
+    Keypoints are detected on a pyramid level whose longer side is capped,
+    limited in number, and matched against each other through a FLANN
+    index (KD-tree for SIFT, LSH for ORB), so runtime stays close to
+    linear in the keypoint count. Matched pairs are clustered by their
+    displacement vector: a cloned region shows up as many pairs sharing
+    the same shift. Distances are in pixels of the analysed level.
+    """
+    settings = COPY_MOVE_MODES[mode]
+    level, scale = _pyramid_level(gray, settings['max_side'])
+    detector = _create_detector(settings['detector'], settings['max_keypoints'])
+    keypoints, descriptors = detector.detectAndCompute(level, None)
+
+    result = {
+        'mode': mode,
+        'scale': scale,
+        'keypoints': len(keypoints),
+        'matches': 0,
+        'clustered_matches': 0,
+        'region_pairs': []
+    }
+    if descriptors is None or len(keypoints) < 3:
+        return result
+
+    if settings['detector'] == 'sift':
+        descriptors = np.float32(descriptors)
+    queries, trains = _self_matches(descriptors, _create_matcher(settings['detector']), settings['ratio'])
+    if queries.size == 0:
+        return result
+
+    points = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+    source, target = points[queries], points[trains]
+    shift = target - source
+    # A pair is found from both of its ends; orient every shift the same way and keep one copy
+    flip = (shift[:, 0] < 0) | ((shift[:, 0] == 0) & (shift[:, 1] < 0))
+    source, target = np.where(flip[:, None], target, source), np.where(flip[:, None], source, target)
+    shift = target - source
+    far_enough = np.hypot(shift[:, 0], shift[:, 1]) >= min_distance
+    source, target, shift = source[far_enough], target[far_enough], shift[far_enough]
+    _, unique = np.unique(np.round(np.hstack([source, target])).astype(np.int64), axis=0, return_index=True)
+    source, target, shift = source[unique], target[unique], shift[unique]
+    result['matches'] = int(len(source))
+    if len(source) == 0:
+        return result
+
+    # Pairs from one cloned region share (nearly) the same displacement
+    bins = np.floor(shift / bin_size).astype(np.int64)
+    keys, labels, counts = np.unique(bins, axis=0, return_inverse=True, return_counts=True)
+    labels = labels.reshape(-1)
+
+    # Merge neighbouring bins so a shift that straddles a bin edge is not split in two
+    group_of_key = {}
+    group_of_bin = np.empty(len(counts), dtype=np.int64)
+    group_count = 0
+    for b in np.argsort(counts)[::-1]:
+        bx, by = keys[b]
+        neighbours = [group_of_key.get((bx + ox, by + oy)) for ox in (-1, 0, 1) for oy in (-1, 0, 1)]
+        neighbours = [group for group in neighbours if group is not None]
+        if neighbours:
+            group_of_bin[b] = neighbours[0]
+        else:
+            group_of_bin[b] = group_count
+            group_count += 1
+        group_of_key[(bx, by)] = group_of_bin[b]
+    pair_groups = group_of_bin[labels]
+    sizes = np.bincount(pair_groups)
+
+    for index in np.argsort(sizes)[::-1][:max_region_pairs]:
+        if sizes[index] < min_cluster_size:
+            break
+        members = pair_groups == index
+        mean_shift = shift[members].mean(axis=0) * scale
+        result['region_pairs'].append({
+            'source': _bounding_box(source[members], scale),
+            'target': _bounding_box(target[members], scale),
+            'matches': int(members.sum()),
+            'shift': [float(mean_shift[0]), float(mean_shift[1])]
+        })
+    result['clustered_matches'] = int(sum(pair['matches'] for pair in result['region_pairs']))
+    return result
+
+def scale_copy_move(result, scale):
+    """Map the region pairs of a detect_copy_move result from a downscaled image back to full resolution"""
+    for pair in result['region_pairs']:
+        for key in ('source', 'target'):
+            pair[key] = {name: int(value * scale) for name, value in pair[key].items()}
+        pair['shift'] = [value * scale for value in pair['shift']]
+    return result
@@ -1,102 +1,302 @@
+"""Generate synthetic test images: the six samples, or a large labelled corpus.
+
+Without --count the six images in sample_images/ are regenerated. With
+--count, N images are written to --output together with manifest.jsonl,
+one ground-truth record per image (label, manipulation, its parameters
+and the affected regions), which benchmarks/suite.py and
+benchmarks/accuracy.py read. Image i is generated from the seed
+(--seed, i) alone, so a corpus is identical whatever --workers is.
+
+Usage:
+    python generate_sample_images.py
+    python generate_sample_images.py --count 20000 --output corpus --width 4032 --height 3024 --workers 8
+"""
+import argparse
+import json
+import multiprocessing
 import os
-import numpy as np
+import struct
+import sys
+import time
+
 import cv2
-from PIL import Image, ImageDraw
-import random
-from datetime import datetime
-
-def create_authentic_image(filename, with_exif=True):
-    """Create an authentic-looking image with optional EXIF data"""
-    # Create a simple image with a gradient
-    img = np.zeros((400, 400, 3), dtype=np.uint8)
-    
-    # Add a gradient
-    for i in range(400):
-        for j in range(400):
-            img[i, j] = [i % 256, j % 256, (i + j) % 256]
-    
-    # Add some random noise to make it look more natural
-    noise = np.random.normal(0, 10, (400, 400, 3)).astype(np.uint8)
-    img = cv2.add(img, noise)
-    
-    # Save the image
-    cv2.imwrite(filename, img)
-    
-    if with_exif:
-        # Add EXIF data using PIL
-        img_pil = Image.open(filename)
-        exif = img_pil.getexif()
-        exif[0x010F] = "Sample Camera"  # Make
-        exif[0x0110] = "Model X"        # Model
-        exif[0x0132] = datetime.now().strftime("%Y:%m:%d %H:%M:%S")  # DateTime
-        img_pil.save(filename, exif=exif)
-    
-    return filename
-
-def create_compressed_image(original_filename, output_filename, quality=30):
-    """Create a compressed version of an image"""
-    img = cv2.imread(original_filename)
-    cv2.imwrite(output_filename, img, [cv2.IMWRITE_JPEG_QUALITY, quality])
-    return output_filename
-
-def create_cloned_image(original_filename, output_filename):
-    """Create an image with cloned regions"""
-    img = cv2.imread(original_filename)
-    height, width = img.shape[:2]
-    
-    # Clone a region
-    clone_size = 100
-    source_x = random.randint(0, width - clone_size)
-    source_y = random.randint(0, height - clone_size)
-    target_x = random.randint(0, width - clone_size)
-    target_y = random.randint(0, height - clone_size)
-    
-    # Copy the region
-    cloned_region = img[source_y:source_y+clone_size, source_x:source_x+clone_size].copy()
-    img[target_y:target_y+clone_size, target_x:target_x+clone_size] = cloned_region
-    
-    cv2.imwrite(output_filename, img)
-    return output_filename
-
-def create_combined_manipulation(original_filename, output_filename):
-    """Create an image with both compression and cloning"""
-    # First create a cloned version
-    temp_filename = "temp_cloned.jpg"
-    create_cloned_image(original_filename, temp_filename)
-    
-    # Then compress it
-    create_compressed_image(temp_filename, output_filename, quality=40)
-    
-    # Clean up temporary file
-    os.remove(temp_filename)
-    return output_filename
+import numpy as np
+from PIL import Image
+
+MANIPULATIONS = ('splice', 'copy_move', 'recompress', 'exif_strip')
+
+def authentic_image(width, height, rng):
+    """Camera-like BGR image: lighting gradient, multi-scale texture, a few solid shapes and sensor noise
+
+    Noise is added before the single clip to 0-255, so dark pixels cannot
+    wrap around. It is the sum of the two nibbles of a random byte, a
+    near-Gaussian (triangular) value with standard deviation 6.5 that is
+    several times cheaper to draw than normals.
+    """
+    noise_scale = rng.uniform(2, 6) / 6.5
+    # Smooth lighting across the frame, broadcast from one row and one column; the
+    # noise's mean of 15 is subtracted here instead of from every pixel
+    direction = rng.uniform(-1, 1, (2, 3)).astype(np.float32)
+    row = 128 - 15 * noise_scale + 60 * np.linspace(0, 1, width, dtype=np.float32)[None, :, None] * direction[0]
+    column = 60 * np.linspace(0, 1, height, dtype=np.float32)[:, None, None] * direction[1]
+    image = row + column
+
+    # Texture at a few scales, each interpolated up from a coarse random grid
+    for cells, amplitude in ((4, 50.0), (32, 25.0), (256, 10.0)):
+        coarse = rng.standard_normal((max(2, cells * height // width), cells, 3), dtype=np.float32)
+        image = cv2.scaleAdd(cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC), amplitude, image)
+
+    # Solid shapes give the keypoint detectors corners and edges to work with
+    scale = min(width, height)
+    for _ in range(rng.integers(3, 9)):
+        color = tuple(float(c) for c in rng.integers(0, 256, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        size = int(rng.uniform(0.03, 0.15) * scale)
+        if rng.random() < 0.5:
+            cv2.circle(image, center, size, color, -1, cv2.LINE_AA)
+        else:
+            cv2.rectangle(image, center, (center[0] + size, center[1] + size), color, -1)
+
+    random_bytes = np.frombuffer(rng.bytes(image.size), dtype=np.uint8).reshape(image.shape)
+    noise = (random_bytes & 15) + (random_bytes >> 4)
+    image = cv2.scaleAdd(noise.astype(np.float32), noise_scale, image)
+    return np.clip(image, 0, 255, out=image).astype(np.uint8)
+
+def camera_exif(rng):
+    """APP1 EXIF payload with camera make, model and a capture date drawn from `rng`"""
+    exif = Image.Exif()
+    captured = f"{rng.integers(2015, 2025)}:{rng.integers(1, 13):02d}:{rng.integers(1, 29):02d} " \
+               f"{rng.integers(0, 24):02d}:{rng.integers(0, 60):02d}:{rng.integers(0, 60):02d}"
+    exif[0x010F] = 'Sample Camera'  # Make
+    exif[0x0110] = f"Model {'XYZ'[rng.integers(0, 3)]}"  # Model
+    exif[0x0132] = captured  # DateTime
+    return exif.tobytes()
+
+def encode_jpeg(image, quality, exif=None):
+    """Encode a BGR image as JPEG in memory, inserting an EXIF APP1 segment after the JFIF header"""
+    data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])[1].tobytes()
+    if exif is None:
+        return data
+    position = 2
+    if data[2:4] == b'\xff\xe0':
+        position += 2 + struct.unpack('>H', data[4:6])[0]
+    return data[:position] + b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif + data[position:]
+
+def _box(x, y, size):
+    return {'x': int(x), 'y': int(y), 'width': int(size), 'height': int(size)}
+
+def _add_details(patch, rng, count=8):
+    """Draw small high-contrast shapes into `patch` so it has corners for keypoint detectors
+
+    The smooth texture of authentic_image has few keypoints of its own, so
+    a cloned square of it alone would be nearly invisible to a copy-move
+    detector, unlike cloned objects in a photo.
+    """
+    side = patch.shape[0]
+    for _ in range(count):
+        color = tuple(float(c) for c in rng.integers(0, 256, 3))
+        size = max(2, int(rng.uniform(0.05, 0.2) * side))
+        x, y = (int(v) for v in rng.integers(0, max(1, side - size), 2))
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.rectangle(patch, (x, y), (x + size, y + size // 2), color, -1)
+        elif kind == 1:
+            cv2.circle(patch, (x + size // 2, y + size // 2), size // 2, color, -1, cv2.LINE_AA)
+        else:
+            cv2.line(patch, (x, y), (x + size, y + int(rng.integers(0, size + 1))), color, max(1, size // 8))
+
+def copy_move(image, rng, size=0.15):
+    """Copy a square of side `size` * the shorter side to a non-overlapping spot of the same image
+
+    Small shapes are drawn into the source square first (see _add_details),
+    so the clone carries the kind of detail a real one would.
+    """
+    height, width = image.shape[:2]
+    side = max(8, int(size * min(width, height)))
+    sx, sy = rng.integers(0, width - side), rng.integers(0, height - side)
+    for _ in range(100):
+        tx, ty = rng.integers(0, width - side), rng.integers(0, height - side)
+        if abs(int(tx) - int(sx)) >= side or abs(int(ty) - int(sy)) >= side:
+            break
+    source = image[sy:sy + side, sx:sx + side]
+    _add_details(source, rng)
+    image[ty:ty + side, tx:tx + side] = source
+    return {'size': size}, [{'role': 'source', **_box(sx, sy, side)}, {'role': 'target', **_box(tx, ty, side)}]
+
+def splice(image, rng, size=0.2, feather=4):
+    """Paste a square from a different synthetic scene, blending its border over `feather` pixels"""
+    height, width = image.shape[:2]
+    side = max(8, int(size * min(width, height)))
+    donor = authentic_image(side, side, rng)
+    tx, ty = rng.integers(0, width - side), rng.integers(0, height - side)
+    alpha = np.zeros((side, side), dtype=np.float32)
+    alpha[feather:side - feather, feather:side - feather] = 1
+    if feather:
+        alpha = cv2.GaussianBlur(alpha, (0, 0), feather / 2)
+    alpha = alpha[:, :, None]
+    target = image[ty:ty + side, tx:tx + side]
+    target[:] = (donor * alpha + target * (1 - alpha)).astype(np.uint8)
+    return {'size': size, 'feather': feather}, [{'role': 'target', **_box(tx, ty, side)}]
+
+def recompress(image, rng, first_quality=None, shift=None):
+    """Simulate an earlier JPEG save: compress at `first_quality`, decode, and optionally crop by `shift` pixels
+
+    A shift that is not a multiple of 8 moves the old block grid off the
+    grid of the final save.
+    """
+    first_quality = int(rng.integers(50, 81)) if first_quality is None else first_quality
+    shift = int(rng.choice([0, 0, 1, 2, 3, 4, 5, 6, 7])) if shift is None else shift
+    decoded = cv2.imdecode(np.frombuffer(encode_jpeg(image, first_quality), dtype=np.uint8), cv2.IMREAD_COLOR)
+    image[:] = cv2.copyMakeBorder(decoded[shift:, shift:], 0, shift, 0, shift, cv2.BORDER_REPLICATE)
+    return {'first_quality': first_quality, 'shift': shift}, []
+
+def generate_item(index, seed, width, height, quality, manipulated_fraction, manipulations, megapixels=None):
+    """Build image `index` of a corpus; return (jpeg_bytes, manifest_record)"""
+    rng = np.random.default_rng([seed, index])
+    if megapixels:
+        # Pick a 4:3 resolution from the list
+        area = float(rng.choice(megapixels)) * 1e6
+        width = int(round((area * 4 / 3) ** 0.5))
+        height = int(round(width * 3 / 4))
+    image = authentic_image(width, height, rng)
+    exif = camera_exif(rng)
+
+    manipulation = None
+    params, regions = {}, []
+    if rng.random() < manipulated_fraction:
+        manipulation = str(rng.choice(manipulations))
+        if manipulation == 'copy_move':
+            params, regions = copy_move(image, rng, size=float(rng.uniform(0.08, 0.2)))
+        elif manipulation == 'splice':
+            params, regions = splice(image, rng, size=float(rng.uniform(0.1, 0.25)))
+        elif manipulation == 'recompress':
+            params, regions = recompress(image, rng)
+        elif manipulation == 'exif_strip':
+            exif = None
+
+    data = encode_jpeg(image, quality, exif)
+    return data, {
+        'index': index,
+        'seed': [seed, index],
+        'width': width,
+        'height': height,
+        'label': 'authentic' if manipulation is None else 'manipulated',
+        'manipulation': manipulation,
+        'params': params,
+        'regions': regions,
+        'quality': quality,
+        'exif': exif is not None,
+        'bytes': len(data)
+    }
+
+def _write_item(job):
+    index, output, options = job
+    data, record = generate_item(index, **options)
+    record['file'] = f"img_{index:07d}.jpg"
+    with open(os.path.join(output, record['file']), 'wb') as f:
+        f.write(data)
+    return record
+
+def _init_worker():
+    # Parallelism comes from the pool; keep OpenCV from oversubscribing the cores
+    cv2.setNumThreads(1)
+
+def generate_corpus(output, count, seed=0, width=1600, height=1200, quality=90, manipulated_fraction=0.5,
+                    manipulations=MANIPULATIONS, megapixels=None, workers=None):
+    """Write `count` images and manifest.jsonl (sorted by index) to `output`; return the manifest path"""
+    os.makedirs(output, exist_ok=True)
+    options = {
+        'seed': seed,
+        'width': width,
+        'height': height,
+        'quality': quality,
+        'manipulated_fraction': manipulated_fraction,
+        'manipulations': list(manipulations),
+        'megapixels': megapixels
+    }
+    jobs = ((index, output, options) for index in range(count))
+    records = []
+    started = time.monotonic()
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for done, record in enumerate(pool.imap_unordered(_write_item, jobs, chunksize=8), 1):
+            records.append(record)
+            if done % 100 == 0 or done == count:
+                rate = done / max(time.monotonic() - started, 1e-9)
+                sys.stderr.write(f"\r{done}/{count} images  {rate:.1f} images/s  ")
+                sys.stderr.flush()
+    sys.stderr.write('\n')
+
+    manifest = os.path.join(output, 'manifest.jsonl')
+    with open(manifest, 'w') as f:
+        for record in sorted(records, key=lambda record: record['index']):
+            f.write(json.dumps(record) + '\n')
+    return manifest
+
+def load_manifest(path):
+    """Read a manifest written by generate_corpus; image paths are resolved next to it"""
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    for record in records:
+        record['path'] = os.path.join(directory, record['file'])
+    return records
+
+def generate_samples(directory='sample_images', seed=0):
+    """Write the six sample images used for manual testing"""
+    os.makedirs(directory, exist_ok=True)
+    samples = [
+        ('authentic_1.jpg', None, True),
+        ('authentic_2.jpg', None, True),
+        ('authentic_3.jpg', None, False),
+        ('manipulated_1.jpg', 'recompress', True),
+        ('manipulated_2.jpg', 'copy_move', True),
+        ('manipulated_3.jpg', 'copy_move+recompress', True),
+    ]
+    for index, (filename, manipulation, with_exif) in enumerate(samples):
+        rng = np.random.default_rng([seed, index])
+        image = authentic_image(400, 400, rng)
+        exif = camera_exif(rng) if with_exif else None
+        if manipulation and 'copy_move' in manipulation:
+            copy_move(image, rng, size=0.25)
+        if manipulation and 'recompress' in manipulation:
+            # A heavy earlier save under the final q90 one, so the image is really double-compressed
+            recompress(image, rng, first_quality=30 if manipulation == 'recompress' else 40)
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(encode_jpeg(image, 90, exif))
 
-def main():
-    # Create sample_images directory if it doesn't exist
-    os.makedirs("sample_images", exist_ok=True)
-    
-    # Generate authentic images
-    print("Generating authentic images...")
-    authentic_1 = create_authentic_image("sample_images/authentic_1.jpg", with_exif=True)
-    authentic_2 = create_authentic_image("sample_images/authentic_2.jpg", with_exif=True)
-    authentic_3 = create_authentic_image("sample_images/authentic_3.jpg", with_exif=False)
-    
-    # Generate manipulated images
-    print("Generating manipulated images...")
-    manipulated_1 = create_compressed_image(authentic_1, "sample_images/manipulated_1.jpg", quality=30)
-    manipulated_2 = create_cloned_image(authentic_2, "sample_images/manipulated_2.jpg")
-    manipulated_3 = create_combined_manipulation(authentic_3, "sample_images/manipulated_3.jpg")
-    
     print("Sample images generated successfully!")
     print("\nGenerated images:")
     print("1. Authentic images:")
-    print(f"   - {authentic_1} (with complete EXIF data)")
-    print(f"   - {authentic_2} (with minimal EXIF data)")
-    print(f"   - {authentic_3} (with no EXIF data)")
+    print(f"   - {directory}/authentic_1.jpg, authentic_2.jpg (with EXIF data)")
+    print(f"   - {directory}/authentic_3.jpg (with no EXIF data)")
     print("\n2. Manipulated images:")
-    print(f"   - {manipulated_1} (compression artifacts)")
-    print(f"   - {manipulated_2} (cloned regions)")
-    print(f"   - {manipulated_3} (compression + cloning)")
+    print(f"   - {directory}/manipulated_1.jpg (compression artifacts)")
+    print(f"   - {directory}/manipulated_2.jpg (cloned regions)")
+    print(f"   - {directory}/manipulated_3.jpg (compression + cloning)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, help='Generate a corpus of this many images instead of the samples')
+    parser.add_argument('--output', default=None, help='Corpus directory (default corpus/, or sample_images/ for the samples)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=1600)
+    parser.add_argument('--height', type=int, default=1200)
+    parser.add_argument('--megapixels', nargs='+', type=float, help='Pick each image size from these (4:3) instead of --width/--height')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the final save')
+    parser.add_argument('--manipulated-fraction', type=float, default=0.5)
+    parser.add_argument('--manipulations', nargs='+', choices=MANIPULATIONS, default=list(MANIPULATIONS))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.count is None:
+        generate_samples(args.output or 'sample_images', args.seed)
+        return
+    manifest = generate_corpus(
+        args.output or 'corpus', args.count, seed=args.seed, width=args.width, height=args.height,
+        quality=args.quality, manipulated_fraction=args.manipulated_fraction,
+        manipulations=args.manipulations, megapixels=args.megapixels, workers=args.workers
+    )
+    print(f"Wrote {args.count} images and {manifest}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,56 @@
+"""Gunicorn settings for serving the app with a shared, preloaded model.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+With preload_app the master imports app.py once: heavy modules, the model
+weights and the warmup pass all happen before forking, and the workers
+share those pages copy-on-write instead of each loading their own copy.
+Background threads (inference batching, job workers) start lazily inside
+each worker.
+
+Every worker must see the results and job records the others wrote: a
+report or job poll can reach any of them. With more than one worker,
+startup is refused unless RESULTS_STORE and JOB_STORE are 'sqlite' (the
+default); the in-process 'memory' stores need WEB_CONCURRENCY=1.
+"""
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# Threads let concurrent requests in one worker share inference batches
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = True
+
+def on_starting(server):
+    from app import app
+
+    in_process = [name for name in ('RESULTS_STORE', 'JOB_STORE') if app.config[name] != 'sqlite']
+    if server.cfg.workers > 1 and in_process:
+        raise RuntimeError(
+            f"{' and '.join(in_process)} must be 'sqlite' with {server.cfg.workers} workers; "
+            "in-process stores are not shared between them"
+        )
+
+def when_ready(server):
+    from app import startup_timings
+    server.log.info('App loaded in master: ' + ', '.join(
+        f"{name} {seconds:.2f}s" for name, seconds in startup_timings.items()
+    ))
+    # Move everything allocated so far out of the collector's reach; otherwise
+    # a collection in a worker writes to those objects and un-shares their pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    import torch
+    from app import app
+
+    # Split the cores between workers instead of every worker using all of them,
+    # unless TORCH_THREADS or the app's INFERENCE_THREADS sets the count
+    threads_per_worker = os.environ.get('TORCH_THREADS') or app.config['INFERENCE_THREADS']
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(int(threads_per_worker))
@@ -0,0 +1,79 @@
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# cv2 decode flags for 1/1, 1/2, 1/4 and 1/8 scale; JPEGs are scaled by libjpeg while decoding
+REDUCED_COLOR = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+class ImageContext:
+    """Decoded image shared by every analyzer handling a single request.
+
+    The file is decoded once into a BGR array; the grayscale, RGB and any
+    analyzer-specific views (such as the model input tensor) are created on
+    first use and cached for the lifetime of the context.
+    """
+
+    def __init__(self, bgr, path=None, reduction=1):
+        self.path = path
+        self.reduction = reduction
+        self._views = {'bgr': bgr}
+        self._lock = threading.Lock()
+        self._view_locks = {}
+
+    @classmethod
+    def from_path(cls, image_path, reduction=1):
+        """Decode an image file at 1/`reduction` scale, returning None if it cannot be read"""
+        bgr = cv2.imread(image_path, REDUCED_COLOR[reduction])
+        if bgr is None:
+            return None
+        return cls(bgr, path=image_path, reduction=reduction)
+
+    @classmethod
+    def from_bytes(cls, data, reduction=1):
+        """Decode an encoded image held in memory at 1/`reduction` scale, returning None if it cannot be read"""
+        bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_COLOR[reduction])
+        if bgr is None:
+            return None
+        return cls(bgr, reduction=reduction)
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def bgr(self):
+        return self._views['bgr']
+
+    @property
+    def gray(self):
+        return self.view('gray', lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def rgb(self):
+        """RGB view as a PIL image"""
+        return self.view('rgb', lambda: Image.fromarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)))
+
+    def view(self, name, factory):
+        """Return the cached view called `name`, building it with `factory` on first use"""
+        views = self._views
+        if name in views:
+            return views[name]
+        with self._lock:
+            view_lock = self._view_locks.setdefault(name, threading.Lock())
+        with view_lock:
+            if name not in views:
+                views[name] = factory()
+        return views[name]
+
+def as_image_context(image):
+    """Accept either an image path or an ImageContext and return a context (or None)"""
+    if isinstance(image, ImageContext):
+        return image
+    return ImageContext.from_path(image)
@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+class InferenceEngine:
+    """Micro-batching front end for a ForgeryDetector.
+
+    Request threads submit preprocessed (1, 3, 224, 224) tensors. A single
+    background thread gathers whatever arrives within `max_wait_ms` of the
+    first pending tensor (up to `max_batch_size` tensors), runs one forward
+    pass over the batch and hands each caller its own forgery probability.
+    The thread starts on the first submission, and again in a forked child,
+    so an engine built before gunicorn forks its workers still works there.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.stats = {'batches': 0, 'images': 0}
+
+    def _ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Threads do not survive fork; start a fresh queue and thread in this process
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,), name='inference-engine', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, image_tensor):
+        """Queue a preprocessed tensor and return a Future for its forgery probability"""
+        if self._closed:
+            raise RuntimeError('Inference engine is closed')
+        self._ensure_running()
+        future = Future()
+        self._queue.put((image_tensor, future))
+        return future
+
+    def predict(self, image_tensor, timeout=None):
+        """Return the forgery probability for one preprocessed tensor"""
+        return self.submit(image_tensor).result(timeout)
+
+    def close(self):
+        """Stop the batching thread once the queued tensors are processed"""
+        if not self._closed:
+            self._closed = True
+            if self._pid == os.getpid():
+                self._queue.put(None)
+                self._thread.join()
+
+    def _collect_batch(self, requests):
+        item = requests.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then let the loop see the shutdown marker
+                requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = self._collect_batch(requests)
+            if batch is None:
+                return
+            # Drop requests whose callers cancelled while waiting
+            batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+            tensors = [tensor for tensor, _ in batch]
+            futures = [future for _, future in batch]
+            if not tensors:
+                continue
+            try:
+                with torch.no_grad():
+                    output = self.model(torch.cat(tensors, dim=0))
+                    probabilities = torch.softmax(output, dim=1)[:, 1].tolist()
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.stats['batches'] += 1
+            self.stats['images'] += len(tensors)
+            for future, probability in zip(futures, probabilities):
+                future.set_result(float(probability))
@@ -0,0 +1,234 @@
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+class MemoryJobRecords:
+    """Job records in a dict, visible only to the process that ran the job.
+
+    Finished jobs are kept until `max_finished_jobs` newer ones replace
+    them. Use SQLiteJobRecords when several gunicorn workers serve the job
+    API: a client polling /jobs/<id> may reach any of them.
+    """
+
+    def __init__(self, max_finished_jobs=1000):
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs = OrderedDict()
+        self._finished = deque()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            if fields.get('finished_at') is not None:
+                # Forget the oldest finished jobs once the retention limit is reached
+                self._finished.append(job_id)
+                while len(self._finished) > self.max_finished_jobs:
+                    self._jobs.pop(self._finished.popleft(), None)
+
+    def get(self, job_id):
+        """Return a copy of a job record, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job)
+
+class SQLiteJobRecords:
+    """Job records in a SQLite database shared by every worker process.
+
+    A job runs in the worker that accepted it, but its status and result
+    are written here, so any worker can answer a poll. Finished jobs beyond
+    the `max_finished_jobs` most recent are deleted through an index. Each
+    thread uses its own connection, and connections opened before a fork
+    are not reused in the child.
+    """
+
+    FIELDS = ('id', 'status', 'submitted_at', 'started_at', 'finished_at', 'result', 'error')
+
+    def __init__(self, path, max_finished_jobs=1000):
+        self.path = path
+        self.max_finished_jobs = max_finished_jobs
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, status TEXT NOT NULL, submitted_at REAL NOT NULL, '
+                'started_at REAL, finished_at REAL, result TEXT, error TEXT)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, job):
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT INTO jobs (id, status, submitted_at) VALUES (?, ?, ?)',
+                (job['id'], job['status'], job['submitted_at'])
+            )
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connection() as connection:
+            connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            if fields.get('finished_at') is not None:
+                connection.execute(
+                    'DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE finished_at IS NOT NULL '
+                    'ORDER BY finished_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_finished_jobs,)
+                )
+
+    def get(self, job_id):
+        """Return a job record, or None if it is unknown or expired"""
+        row = self._connection().execute(
+            f"SELECT {', '.join(self.FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.FIELDS, row))
+        if job['result'] is not None:
+            job['result'] = json.loads(job['result'])
+        return job
+
+def create_job_records(backend='sqlite', path=None, max_finished_jobs=1000):
+    """Build the job records named by `backend` ('sqlite' or, for a single process, 'memory')"""
+    if backend == 'sqlite':
+        return SQLiteJobRecords(path, max_finished_jobs=max_finished_jobs)
+    if backend == 'memory':
+        return MemoryJobRecords(max_finished_jobs=max_finished_jobs)
+    raise ValueError(f'Unknown job store backend: {backend}')
+
+class JobQueue:
+    """Bounded queue of analysis jobs drained by a local worker pool.
+
+    `submit` never blocks: it returns None when `max_queue_size` jobs are
+    already waiting, so callers can shed load instead of piling up work.
+    Each worker calls `handler(*args)` and records the returned dict as the
+    job result (a dict with an 'error' key marks the job failed) in
+    `records` (see create_job_records; in-process by default). Workers
+    start on the first submission in each process, so a queue built
+    before gunicorn forks is usable in every worker.
+    """
+
+    def __init__(self, handler, workers=2, max_queue_size=32, max_finished_jobs=1000, records=None):
+        self.handler = handler
+        self.workers = workers
+        self.records = records or MemoryJobRecords(max_finished_jobs)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._wait_times = deque(maxlen=256)
+        self._run_times = deque(maxlen=256)
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'running': 0}
+        self._threads = []
+        self._pid = None
+
+    def _ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._threads = [
+                    threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, *args):
+        """Queue a job and return its record, or None if the queue is full"""
+        self._ensure_running()
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'result': None,
+            'error': None
+        }
+        with self._lock:
+            if self._queue.full():
+                self.stats['rejected'] += 1
+                return None
+            # Record the job before a worker can pick it up; only this lock's holder adds to the queue
+            self.records.add(job)
+            self._queue.put_nowait((job['id'], job['submitted_at'], args))
+            self.stats['submitted'] += 1
+        return dict(job)
+
+    def get(self, job_id):
+        """Return a snapshot of a job record, or None if it is unknown or expired"""
+        return self.records.get(job_id)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before retrying"""
+        with self._lock:
+            run_time = sum(self._run_times) / len(self._run_times) if self._run_times else 1.0
+        return max(1, math.ceil(run_time * self._queue.qsize() / self.workers))
+
+    def get_stats(self):
+        with self._lock:
+            wait_times = sorted(self._wait_times)
+            run_times = list(self._run_times)
+            stats = dict(self.stats)
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'workers': self.workers,
+            'mean_wait_seconds': sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            'p95_wait_seconds': wait_times[int(0.95 * (len(wait_times) - 1))] if wait_times else 0.0,
+            'mean_run_seconds': sum(run_times) / len(run_times) if run_times else 0.0
+        })
+        return stats
+
+    def _work(self):
+        while True:
+            job_id, submitted_at, args = self._queue.get()
+            started = time.time()
+            with self._lock:
+                self.stats['running'] += 1
+                self._wait_times.append(started - submitted_at)
+            self.records.update(job_id, status='running', started_at=started)
+            
+            try:
+                result = self.handler(*args)
+            except Exception as e:
+                result = {'error': str(e)}
+            
+            finished = time.time()
+            if isinstance(result, dict) and 'error' in result:
+                self.records.update(job_id, status='failed', error=result['error'], finished_at=finished)
+                outcome = 'failed'
+            else:
+                self.records.update(job_id, status='done', result=result, finished_at=finished)
+                outcome = 'completed'
+            with self._lock:
+                self.stats['running'] -= 1
+                self.stats[outcome] += 1
+                self._run_times.append(finished - started)
+            self._queue.task_done()
@@ -0,0 +1,309 @@
+import cv2
+import numpy as np
+
+BLOCK = 8
+
+# Orthonormal 8-point DCT-II matrix; D @ block @ D.T matches cv2.dct on an 8x8 block
+DCT_MATRIX = np.array([
+    [(np.sqrt(1 / BLOCK) if u == 0 else np.sqrt(2 / BLOCK)) * np.cos((2 * x + 1) * u * np.pi / (2 * BLOCK))
+     for x in range(BLOCK)]
+    for u in range(BLOCK)
+], dtype=np.float32)
+
+# Low-frequency AC coefficients (zigzag order) used for double-quantization analysis
+DQ_FREQUENCIES = [(0, 1), (1, 0), (2, 0), (1, 1), (0, 2), (0, 3), (1, 2), (2, 1), (3, 0)]
+DQ_HISTOGRAM_RANGE = 64
+# Neighbourhood (in blocks) pooled when estimating a block's grid phase
+POOL_BLOCKS = 5
+# Below this the image shows no JPEG grid (never compressed, or resampled since); up to 1.07 measured on uncompressed 400px images
+MIN_GRID_STRENGTH = 1.1
+# Frequencies that must show double quantization before the image is called double compressed
+MIN_DQ_FREQUENCIES = 3
+# Fraction of blocks that look off-grid in single-compressed images by chance; up to 0.31 measured on 400px q90 originals
+MAX_AUTHENTIC_MISALIGNED_FRACTION = 0.4
+
+def blockwise_dct(pixels, size=BLOCK):
+    """DCT of every 8x8 block of a (8*rows, 8*cols) array
+
+    Only the top-left `size` x `size` (lowest-frequency) coefficients are
+    computed. Returns a (rows, cols, size, size) float32 array.
+    """
+    rows, cols = pixels.shape[0] // BLOCK, pixels.shape[1] // BLOCK
+    basis = DCT_MATRIX[:size]
+    # Row transform of every block at once first, so the column transform runs on `size` of 8 columns
+    blocks = np.matmul(np.asarray(pixels, dtype=np.float32).reshape(-1, BLOCK), basis.T)
+    blocks = np.matmul(basis, blocks.reshape(rows, BLOCK, cols * size))
+    blocks = blocks.reshape(rows, size, cols, size).transpose(0, 2, 1, 3)
+    # JPEG level shift; it only affects the DC coefficient
+    blocks[:, :, 0, 0] -= 128.0 * BLOCK
+    return blocks
+
+def _iter_strips(height, start, tile_rows):
+    """Yield (top, bottom) row ranges of whole 8-pixel block rows starting at `start`"""
+    usable = (height - start) // BLOCK * BLOCK
+    for top in range(start, start + usable, tile_rows):
+        yield top, min(top + tile_rows, start + usable)
+
+# Twice the step entering pixel c minus the mean gradient on either side of
+# it, which cancels smooth image content and leaves block-boundary jumps;
+# integer weights let OpenCV filter uint8 pixels into int16 directly
+STEP_KERNEL = np.array([[1, -3, 3, -1]], dtype=np.float32)
+
+def _discontinuities(gray, top, bottom, left, right):
+    """Block-boundary step strength entering each pixel of gray[top:bottom, left:right]
+
+    Returns (horizontal, vertical) int16 arrays scaled by STEP_KERNEL's
+    factor of 2; neighbouring pixels outside the region are used where the
+    image has them.
+    """
+    height, width = gray.shape
+    x0, x1 = max(left - 2, 0), min(right + 1, width)
+    y0, y1 = max(top - 2, 0), min(bottom + 1, height)
+    horizontal = cv2.filter2D(gray[top:bottom, x0:x1], cv2.CV_16S, STEP_KERNEL, anchor=(2, 0))
+    vertical = cv2.filter2D(gray[y0:y1, left:right], cv2.CV_16S, STEP_KERNEL.T, anchor=(0, 2))
+    horizontal = np.abs(horizontal, out=horizontal)[:, left - x0:left - x0 + right - left]
+    vertical = np.abs(vertical, out=vertical)[top - y0:top - y0 + bottom - top]
+    return horizontal, vertical
+
+def _phase_energies(diffs, rows, cols, horizontal):
+    """Mean discontinuity at each of the 8 in-block phases, per block, as (rows, cols, 8)"""
+    # Sums of 8 discontinuities (at most 8 * 2040) fit in int16
+    if horizontal:
+        sums = diffs.reshape(rows, BLOCK, cols * BLOCK).sum(axis=1, dtype=np.int16).reshape(rows, cols, BLOCK)
+    else:
+        # Adding strided column views is much faster than reducing over the innermost axis
+        sums = diffs[:, 0::BLOCK].copy()
+        for phase in range(1, BLOCK):
+            sums += diffs[:, phase::BLOCK]
+        sums = sums.reshape(rows, BLOCK, cols).transpose(0, 2, 1)
+    # The extra 2 undoes STEP_KERNEL's scale
+    return sums.astype(np.float32) / (2 * BLOCK)
+
+def _misalignment(energies, min_energy=1.0, margin=0.25, min_contrast=1.15):
+    """How strongly each block's dominant grid phase disagrees with the image grid, in [0, 1]
+
+    Energies are pooled over each block's neighbourhood first; a single
+    8x8 block has too few samples to tell a grid from texture. A block
+    scores 1 once its strongest off-grid phase beats the aligned phase by
+    `margin` (relative), provided that phase clearly stands out from the
+    average one (i.e. the neighbourhood has a visible grid at all).
+    """
+    pooled = [cv2.blur(np.ascontiguousarray(energies[..., phase]), (POOL_BLOCKS, POOL_BLOCKS))
+              for phase in range(BLOCK)]
+    aligned = pooled[0]
+    off_grid = np.maximum.reduce(pooled[1:])
+    average = sum(pooled) / BLOCK
+    score = np.clip((off_grid - aligned) / (aligned + 1e-10) / margin, 0.0, 1.0)
+    score[(off_grid < min_energy) | (off_grid < min_contrast * average)] = 0.0
+    return score
+
+def _histogram(values, radius):
+    """Histogram of the non-zero values in [-radius, radius]; the zero bin is interpolated"""
+    # Out-of-range values land in the two outermost bins, which are dropped
+    index = np.clip(values, -radius - 1, radius + 1) + (radius + 1)
+    histogram = np.bincount(index.ravel(), minlength=2 * radius + 3)[1:-1].astype(np.float64)
+    histogram[radius] = 0.5 * (histogram[radius - 1] + histogram[radius + 1])
+    return histogram
+
+def _quantization_step(histogram, max_step=16, min_fraction=0.7, min_magnitude=4):
+    """Step of the last JPEG quantization, or 1 if there is none
+
+    After decoding and a fresh DCT, the last quantization leaves nearly
+    every coefficient exactly on a multiple of its step (pixel rounding
+    moves only a few by one). An earlier, coarser quantization is only
+    matched approximately, so the largest step holding `min_fraction` of
+    the coefficients is the last one. Values below `min_magnitude` are
+    left out: they are mostly rounding noise around zero, which outnumbers
+    the few non-zero multiples of a coarse step.
+    """
+    radius = len(histogram) // 2
+    bins = np.arange(-radius, radius + 1)
+    considered = np.abs(bins) >= min_magnitude
+    total = histogram[considered].sum()
+    step = 1
+    for candidate in range(2, max_step + 1):
+        if histogram[considered & (bins % candidate == 0)].sum() >= min_fraction * total:
+            step = candidate
+    return step
+
+def _valleys(histogram, window=8, ratio=0.25, min_count=20):
+    """Bins far below a well-populated bin on each side, and the number of bins that could tell
+
+    A single compression leaves a unimodal histogram whose tails fall off
+    monotonically, so it has no such valleys however steep it is; double
+    quantization empties bins between the ones its first step maps onto.
+    Returns (valley mask, number of bins with at least `min_count` on
+    both sides within `window`).
+    """
+    padded = np.pad(histogram, window)
+    size = len(histogram)
+    left = np.max([padded[window - offset:window - offset + size] for offset in range(1, window + 1)], axis=0)
+    right = np.max([padded[window + offset:window + offset + size] for offset in range(1, window + 1)], axis=0)
+    flanks = np.minimum(left, right)
+    # The interpolated zero bin and its neighbours lie in the dead zone every quantization leaves around zero
+    center = len(histogram) // 2
+    flanks[center - 1:center + 2] = 0.0
+    populated = flanks >= min_count
+    return populated & (histogram < ratio * flanks), int(populated.sum())
+
+def _dq_posteriors(coefficients, min_valleys=2, min_valley_fraction=0.2, smoothing=9):
+    """Per-block evidence that coefficients were quantized only once
+
+    The last JPEG quantization step of each frequency is divided out of
+    its coefficients. What is left has a unimodal histogram after a single
+    compression, while a second compression leaves empty bins between
+    peaks. Frequencies need at least `min_valleys` such gaps, making up
+    `min_valley_fraction` of the populated bins (see _valleys), to count as
+    double quantized. For those, each block's value is weighed against the
+    smoothed histogram: values on the peaks are consistent with double
+    quantization, values in the gaps point to a region that was compressed
+    only once (e.g. pasted in afterwards). Returns (posterior sum, sample
+    count, number of double-quantized frequencies).
+    """
+    radius = DQ_HISTOGRAM_RANGE
+    rows, cols, count = coefficients.shape
+    posterior_sum = np.zeros((rows, cols), dtype=np.float32)
+    samples = np.zeros((rows, cols), dtype=np.float32)
+    periodic = 0
+    kernel = np.ones(smoothing) / smoothing
+    for k in range(count):
+        values = coefficients[..., k].astype(np.int32)
+        histogram = _histogram(values, radius)
+        if histogram.sum() < 256:
+            continue
+        step = _quantization_step(histogram)
+        if step < 2:
+            continue
+
+        values = np.rint(values / step).astype(np.int32)
+        histogram = _histogram(values, radius)
+        valleys, populated = _valleys(histogram)
+        if valleys.sum() < min_valleys or valleys.sum() < min_valley_fraction * populated:
+            continue
+        periodic += 1
+
+        envelope = np.convolve(histogram, kernel, mode='same')
+        single = envelope / (envelope + histogram + 1e-10)
+        in_range = (np.abs(values) <= radius) & (values != 0)
+        bin_index = np.clip(values + radius, 0, 2 * radius)
+        posterior_sum += np.where(in_range, single[bin_index], 0.0).astype(np.float32)
+        samples += in_range
+    return posterior_sum, samples, periodic
+
+def _grid_pass(gray, dx, dy, tile_rows):
+    """Stream the image in strips of blocks starting at (dx, dy)
+
+    Each strip is transformed once for the DCT coefficients and once for
+    the boundary discontinuities, whose per-block phase energies give both
+    the misalignment map and, summed, the grid's phase profile. Returns
+    (coefficients, misalignment map, (column phases, row phases)), with the
+    phases relative to (dx, dy).
+    """
+    height, width = gray.shape
+    rows, cols = (height - dy) // BLOCK, (width - dx) // BLOCK
+    right = dx + cols * BLOCK
+    size = max(max(u, v) for u, v in DQ_FREQUENCIES) + 1
+    frequency_index = tuple(np.array(DQ_FREQUENCIES).T)
+    coefficients = np.empty((rows, cols, len(DQ_FREQUENCIES)), dtype=np.int16)
+    misalignment_map = np.empty((rows, cols), dtype=np.float32)
+    column_phases = np.zeros(BLOCK)
+    row_phases = np.zeros(BLOCK)
+    for top, bottom in _iter_strips(height, dy, tile_rows):
+        block_top = (top - dy) // BLOCK
+        block_rows = (bottom - top) // BLOCK
+        strip = gray[top:bottom, dx:right]
+
+        dct = blockwise_dct(strip, size)
+        coefficients[block_top:block_top + block_rows] = np.clip(
+            np.rint(dct[:, :, frequency_index[0], frequency_index[1]]), -32768, 32767)
+
+        x_diffs, y_diffs = _discontinuities(gray, top, bottom, dx, right)
+        x_energies = _phase_energies(x_diffs, block_rows, cols, horizontal=True)
+        y_energies = _phase_energies(y_diffs, block_rows, cols, horizontal=False)
+        misalignment_map[block_top:block_top + block_rows] = np.maximum(
+            _misalignment(x_energies), _misalignment(y_energies))
+        # The image's first column and row have nothing in front of them
+        column_phases += x_energies[:, 1:].sum(axis=(0, 1))
+        row_phases += y_energies[1 if block_top == 0 else 0:].sum(axis=(0, 1))
+    return coefficients, misalignment_map, (column_phases, row_phases)
+
+def _grid_offset(phases):
+    """((dx, dy), strength) from the column and row phase profiles of a pass at the origin
+
+    (dx, dy) is the column/row at which blocks start and strength is how
+    far the strongest phase stands out from the average one (1.0 means no
+    visible grid). Discontinuities are measured with STEP_KERNEL; plain
+    pixel differences let fine texture outweigh a faint grid and report it
+    a pixel off.
+    """
+    offsets = [int(np.argmax(profile)) for profile in phases]
+    strengths = [float(profile.max() / (profile.mean() + 1e-10)) for profile in phases]
+    return (offsets[0], offsets[1]), min(strengths)
+
+def jpeg_grid_analysis(gray, tile_rows=512):
+    """Blockwise 8x8 DCT analysis on the JPEG grid of a grayscale image
+
+    The image is processed in strips of `tile_rows` rows so peak memory
+    stays bounded regardless of resolution; only a few low-frequency
+    coefficients per block are kept. The first pass assumes the grid
+    starts at the origin, as it does after any JPEG save; only an image
+    cropped since then gets a second pass on its actual grid. Returns a
+    dict with per-block `dq_map` (probability a block was compressed only
+    once while the rest of the image shows double quantization) and
+    `misalignment_map` (discontinuities that do not sit on the image's JPEG
+    grid), plus summary statistics.
+    """
+    tile_rows = max(BLOCK, tile_rows // BLOCK * BLOCK)
+    height, width = gray.shape
+    if height < 2 * BLOCK or width < 2 * BLOCK:
+        empty = np.zeros((height // BLOCK, width // BLOCK), dtype=np.float32)
+        return {
+            'grid_offset': (0, 0), 'grid_strength': 1.0, 'blocks': empty.shape,
+            'periodic_frequencies': 0, 'dq_map': empty, 'misalignment_map': empty
+        }
+
+    coefficients, misalignment_map, phases = _grid_pass(gray, 0, 0, tile_rows)
+    (dx, dy), grid_strength = _grid_offset(phases)
+    if (dx, dy) != (0, 0):
+        coefficients, misalignment_map, _ = _grid_pass(gray, dx, dy, tile_rows)
+    rows, cols = misalignment_map.shape
+
+    posterior_sum, samples, periodic = _dq_posteriors(coefficients)
+    # Pool the per-coefficient evidence over each block's neighbourhood
+    pool = (POOL_BLOCKS, POOL_BLOCKS)
+    dq_map = cv2.blur(posterior_sum, pool) / np.maximum(cv2.blur(samples, pool), 1e-3)
+    dq_map[cv2.blur(samples, pool) < 0.5] = 0.0
+    if periodic < MIN_DQ_FREQUENCIES:
+        dq_map[:] = 0.0
+    if grid_strength < MIN_GRID_STRENGTH:
+        # Without a visible JPEG grid there is nothing to be misaligned with
+        misalignment_map[:] = 0.0
+    return {
+        'grid_offset': (dx, dy),
+        'grid_strength': grid_strength,
+        'blocks': (rows, cols),
+        'periodic_frequencies': periodic,
+        'dq_map': dq_map,
+        'misalignment_map': misalignment_map
+    }
+
+def summarize_jpeg_grid(analysis, block_threshold=0.5):
+    """Reduce a jpeg_grid_analysis result to JSON-friendly summary statistics"""
+    double_quantized = analysis['periodic_frequencies'] >= MIN_DQ_FREQUENCIES
+    dq_map = analysis['dq_map']
+    misalignment_map = analysis['misalignment_map']
+    dq_fraction = float(np.mean(dq_map > block_threshold)) if double_quantized and dq_map.size else 0.0
+    misaligned_fraction = float(np.mean(misalignment_map > block_threshold)) if misalignment_map.size else 0.0
+    # A clear grid that does not start at the origin means the image was cropped after compression
+    grid_shifted = analysis['grid_offset'] != (0, 0) and analysis['grid_strength'] > 2 * MIN_GRID_STRENGTH - 1
+    misaligned = misaligned_fraction > MAX_AUTHENTIC_MISALIGNED_FRACTION
+    return {
+        'grid_offset': list(analysis['grid_offset']),
+        'grid_strength': float(analysis['grid_strength']),
+        'grid_shifted': bool(grid_shifted),
+        'blocks': list(analysis['blocks']),
+        'double_quantization': bool(double_quantized),
+        'dq_block_fraction': dq_fraction,
+        'misaligned_block_fraction': misaligned_fraction,
+        'score': max(dq_fraction, misaligned_fraction if misaligned else 0.0, 1.0 if grid_shifted else 0.0)
+    }
@@ -0,0 +1,169 @@
+import collections
+import io
+import math
+import threading
+
+from PIL import Image
+
+from copy_move import COPY_MOVE_MODES
+
+MB = 1024 * 1024
+
+# Peak memory of each stage on top of the decoded image, measured (ru_maxrss) on 4-36 MP JPEGs
+DECODE_BYTES_PER_PIXEL = 6  # BGR array plus the decoder's working buffers
+RESIDENT_BYTES_PER_PIXEL = 4  # BGR and grayscale views, held for the whole analysis
+DCT_MAX_BYTES = 64 * MB  # jpeg_grid works in strips of 512 rows
+DCT_BYTES_PER_PIXEL = 8
+COPY_MOVE_BYTES_PER_LEVEL_PIXEL = {'sift': 210, 'orb': 16}  # Per pixel of the pyramid level matched
+REGIONS_BYTES_PER_PIXEL = 20  # Label image, ranks and float64 weights for bincount
+CNN_BYTES_PER_PIXEL = 5  # RGB copy and PIL image for the 224x224 resize
+CNN_BYTES = 20 * MB
+HEATMAP_BYTES_PER_PIXEL = 3  # RGB array the tiles are cut from
+HEATMAP_BYTES = 360 * MB  # Tile batches and activations
+THUMBNAIL_BYTES_PER_PIXEL = 8  # PIL's 4-byte RGB image and its converted copy, for report thumbnails
+
+# cv2.IMREAD_REDUCED_* scales; libjpeg decodes JPEGs straight to these sizes in the DCT domain
+REDUCTIONS = (1, 2, 4, 8)
+
+def image_dimensions(image, metadata=None):
+    """(width, height) of an image path or encoded bytes without decoding its pixels
+
+    The header parse done for the metadata analysis is reused when it has
+    the dimensions; other formats fall back to PIL, which only reads the
+    header until pixels are accessed. Returns None if neither can tell.
+    """
+    if metadata and metadata.get('width') and metadata.get('height'):
+        return metadata['width'], metadata['height']
+    try:
+        with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as header:
+            return header.size
+    except Exception:
+        return None
+
+def pyramid_pixels(width, height, max_side):
+    """Pixels of the pyramid level copy-move detection runs on (see copy_move._pyramid_level)"""
+    while max(width, height) > max_side:
+        width, height = (width + 1) // 2, (height + 1) // 2
+    return width * height
+
+def estimate_stages(width, height, mode='accurate', tiled=False):
+    """Estimated peak bytes of each analysis stage for a decoded width x height image"""
+    pixels = width * height
+    settings = COPY_MOVE_MODES[mode]
+    stages = {
+        'dct': min(DCT_BYTES_PER_PIXEL * pixels, DCT_MAX_BYTES),
+        'copy_move': COPY_MOVE_BYTES_PER_LEVEL_PIXEL[settings['detector']] * pyramid_pixels(width, height, settings['max_side']),
+        'regions': REGIONS_BYTES_PER_PIXEL * pixels,
+        'cnn': CNN_BYTES_PER_PIXEL * pixels + CNN_BYTES
+    }
+    if tiled:
+        stages['heatmap'] = HEATMAP_BYTES_PER_PIXEL * pixels + HEATMAP_BYTES
+    return stages
+
+def estimate_peak(width, height, mode='accurate', tiled=False, concurrent=True, reduction=1, jpeg=True):
+    """Estimated peak bytes of analyzing a width x height image decoded at 1/`reduction` scale
+
+    With `concurrent` (PipelineExecutor) the stages overlap, so their peaks
+    add up; otherwise only the largest counts. Formats other than JPEG are
+    decoded at full size before cv2 shrinks them.
+    """
+    reduced_width, reduced_height = math.ceil(width / reduction), math.ceil(height / reduction)
+    reduced = reduced_width * reduced_height
+    decode = DECODE_BYTES_PER_PIXEL * reduced
+    if not jpeg and reduction > 1:
+        decode += DECODE_BYTES_PER_PIXEL * width * height
+    stages = estimate_stages(reduced_width, reduced_height, mode, tiled).values()
+    return max(decode, RESIDENT_BYTES_PER_PIXEL * reduced + (sum(stages) if concurrent else max(stages)))
+
+def estimate_thumbnail(width, height, jpeg=True, max_side=1024):
+    """Estimated peak bytes of decoding a width x height image for a report thumbnail
+
+    PIL's draft mode lets libjpeg decode JPEGs at up to 1/8 scale, as long
+    as the result is still at least `max_side` on its longer side; other
+    formats are decoded at full size.
+    """
+    reduction = 1
+    while jpeg and reduction < REDUCTIONS[-1] and max(width, height) // (reduction * 2) >= max_side:
+        reduction *= 2
+    return THUMBNAIL_BYTES_PER_PIXEL * math.ceil(width / reduction) * math.ceil(height / reduction)
+
+class MemoryGovernor:
+    """Admission control for analyses against a per-process memory budget.
+
+    Before an image is decoded, `plan` estimates the peak memory its
+    analysis will need from the dimensions in its header and picks the
+    smallest cv2.IMREAD_REDUCED_* scale that keeps it under
+    `max_request_bytes`; images that do not fit even at 1/8 are refused.
+    `acquire` then reserves the estimate against `budget_bytes`, queueing
+    (first come, first served) until enough running analyses release
+    theirs, for at most `max_wait` seconds.
+    """
+
+    def __init__(self, budget_bytes, max_request_bytes=None, max_wait=30):
+        self.budget_bytes = budget_bytes
+        self.max_request_bytes = min(max_request_bytes or budget_bytes, budget_bytes)
+        self.max_wait = max_wait
+        self.in_use = 0
+        self._condition = threading.Condition()
+        self._waiting = collections.deque()
+        self.stats = {'admitted': 0, 'downscaled': 0, 'rejected': 0, 'timeouts': 0, 'peak_in_use_bytes': 0}
+
+    def plan(self, width, height, mode='accurate', tiled=False, concurrent=True, jpeg=True):
+        """Choose how to decode a width x height image
+
+        Returns {'reduction', 'bytes', 'width', 'height'} with the
+        estimated peak and decoded size at that scale, or None if the image
+        is too large to analyze at any scale.
+        """
+        for reduction in REDUCTIONS:
+            estimate = estimate_peak(width, height, mode, tiled, concurrent, reduction, jpeg)
+            if estimate <= self.max_request_bytes:
+                if reduction > 1:
+                    with self._condition:
+                        self.stats['downscaled'] += 1
+                return {
+                    'reduction': reduction,
+                    'bytes': estimate,
+                    'width': math.ceil(width / reduction),
+                    'height': math.ceil(height / reduction)
+                }
+        with self._condition:
+            self.stats['rejected'] += 1
+        return None
+
+    def acquire(self, nbytes, timeout=None):
+        """Reserve `nbytes` of the budget, waiting up to `timeout` (default max_wait) seconds
+
+        Returns False if the reservation could not be made in time.
+        """
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            admitted = self._condition.wait_for(
+                lambda: self._waiting[0] is ticket and self.in_use + nbytes <= self.budget_bytes,
+                self.max_wait if timeout is None else timeout
+            )
+            self._waiting.remove(ticket)
+            if admitted:
+                self.in_use += nbytes
+                self.stats['admitted'] += 1
+                self.stats['peak_in_use_bytes'] = max(self.stats['peak_in_use_bytes'], self.in_use)
+            else:
+                self.stats['timeouts'] += 1
+            # The next request in line may fit now
+            self._condition.notify_all()
+        return admitted
+
+    def release(self, nbytes):
+        with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                **self.stats,
+                'budget_bytes': self.budget_bytes,
+                'in_use_bytes': self.in_use,
+                'waiting': len(self._waiting)
+            }
@@ -0,0 +1,556 @@
+import hashlib
+import io
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Upper bound on the header bytes read per image; pixel data is skipped with
+# seeks, so the cost of a lookup does not grow with the image size
+MAX_HEADER_BYTES = 512 * 1024
+MAX_SEGMENTS = 256
+
+# Substrings of Software/CreatorTool values written by image editors
+EDITING_SOFTWARE = (
+    'photoshop', 'gimp', 'lightroom', 'affinity', 'paint.net', 'pixelmator',
+    'snapseed', 'picsart', 'canva', 'photopea', 'fotor', 'facetune'
+)
+
+# IJG (libjpeg) base quantization tables from the JPEG standard, in natural order
+IJG_LUMINANCE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+])
+IJG_CHROMINANCE = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99
+])
+
+# Natural-order index of each coefficient in the zigzag order DQT stores
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# Value size in bytes of each TIFF field type
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8}
+
+EXIF_POINTER = 0x8769
+GPS_POINTER = 0x8825
+IFD0_TAGS = {0x010F: 'make', 0x0110: 'model', 0x0131: 'software', 0x0132: 'datetime', 0x0112: 'orientation'}
+EXIF_TAGS = {
+    0x9003: 'datetime_original',
+    0x9004: 'datetime_digitized',
+    0xA002: 'exif_width',
+    0xA003: 'exif_height',
+    0xA434: 'lens_model'
+}
+MAKER_NOTE = 0x927C
+THUMBNAIL_OFFSET = 0x0201
+THUMBNAIL_LENGTH = 0x0202
+
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+ICC_HEADER = b'ICC_PROFILE\x00'
+
+class _Header:
+    """Bounded reader over a file object: reads count against MAX_HEADER_BYTES, skips are seeks"""
+
+    def __init__(self, f, max_bytes=MAX_HEADER_BYTES):
+        self.f = f
+        self.max_bytes = max_bytes
+        self.remaining = max_bytes
+        self.truncated = False
+
+    def read(self, size):
+        if size > self.remaining:
+            self.truncated = True
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def skip(self, size):
+        self.f.seek(size, io.SEEK_CUR)
+
+    @property
+    def bytes_read(self):
+        return self.max_bytes - self.remaining
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.split(b'\x00', 1)[0].decode('utf-8', 'replace')
+    return value.strip()
+
+def _read_ifd(data, offset, endian):
+    """Decode one TIFF IFD; return ({tag: value}, next_ifd_offset)"""
+    count = struct.unpack_from(endian + 'H', data, offset)[0]
+    entries = {}
+    for i in range(min(count, 512)):
+        entry = offset + 2 + 12 * i
+        if entry + 12 > len(data):
+            break
+        tag, kind, n = struct.unpack_from(endian + 'HHI', data, entry)
+        size = TIFF_TYPE_SIZES.get(kind)
+        if size is None:
+            continue
+        start = entry + 8
+        if size * n > 4:
+            start = struct.unpack_from(endian + 'I', data, entry + 8)[0]
+        raw = data[start:start + size * n]
+        if len(raw) < size * n:
+            continue
+        if kind == 2:
+            entries[tag] = _text(raw)
+        elif kind in (3, 4, 9):
+            fmt = {3: 'H', 4: 'I', 9: 'i'}[kind]
+            values = struct.unpack(endian + fmt * n, raw)
+            entries[tag] = values[0] if n == 1 else values
+        elif kind in (5, 10) and n >= 1:
+            num, den = struct.unpack_from(endian + ('II' if kind == 5 else 'ii'), raw)
+            entries[tag] = num / den if den else 0.0
+        else:
+            entries[tag] = raw
+    next_offset = 0
+    end = offset + 2 + 12 * count
+    if end + 4 <= len(data):
+        next_offset = struct.unpack_from(endian + 'I', data, end)[0]
+    return entries, next_offset
+
+def parse_exif(data):
+    """Parse a TIFF-structured EXIF block into the fields the report uses"""
+    if data[:6] == b'Exif\x00\x00':
+        data = data[6:]
+    endian = {b'II': '<', b'MM': '>'}.get(bytes(data[:2]))
+    if endian is None or struct.unpack_from(endian + 'H', data, 2)[0] != 42:
+        raise ValueError('not a TIFF header')
+
+    ifd0, ifd1_offset = _read_ifd(data, struct.unpack_from(endian + 'I', data, 4)[0], endian)
+    exif = {name: ifd0[tag] for tag, name in IFD0_TAGS.items() if tag in ifd0}
+    exif['has_gps'] = False
+    exif['has_maker_note'] = False
+
+    if EXIF_POINTER in ifd0:
+        sub_ifd, _ = _read_ifd(data, ifd0[EXIF_POINTER], endian)
+        exif.update({name: sub_ifd[tag] for tag, name in EXIF_TAGS.items() if tag in sub_ifd})
+        exif['has_maker_note'] = MAKER_NOTE in sub_ifd
+    if GPS_POINTER in ifd0:
+        gps, _ = _read_ifd(data, ifd0[GPS_POINTER], endian)
+        # Tags 1-4 are the latitude/longitude references and values
+        exif['has_gps'] = any(tag in gps for tag in (1, 2, 3, 4))
+
+    # IFD1 describes the embedded thumbnail, whose bytes sit inside this block
+    if 0 < ifd1_offset < len(data):
+        ifd1, _ = _read_ifd(data, ifd1_offset, endian)
+        offset, length = ifd1.get(THUMBNAIL_OFFSET), ifd1.get(THUMBNAIL_LENGTH)
+        if isinstance(offset, int) and isinstance(length, int) and length > 0:
+            exif['thumbnail'] = bytes(data[offset:offset + length])
+    return exif
+
+def parse_xmp(packet):
+    """Pick the editing history out of an XMP packet"""
+    text = packet.decode('utf-8', 'replace')
+
+    def field(name):
+        match = re.search(rf'{name}\s*=\s*"([^"]*)"|<{name}>([^<]*)</{name}>', text)
+        return (match.group(1) or match.group(2) or '').strip() if match else ''
+
+    return {
+        'creator_tool': field('xmp:CreatorTool'),
+        'modify_date': field('xmp:ModifyDate'),
+        'history_entries': len(re.findall(r'<stEvt:action>|stEvt:action\s*=', text))
+    }
+
+def parse_icc(profile):
+    """Describe an ICC profile from its header and, if present in `profile`, its desc tag"""
+    icc = {
+        'size': struct.unpack_from('>I', profile, 0)[0],
+        'device_class': _text(profile[12:16]),
+        'color_space': _text(profile[16:20]),
+        'description': ''
+    }
+    tag_count = struct.unpack_from('>I', profile, 128)[0]
+    for i in range(min(tag_count, 64)):
+        signature, offset, size = struct.unpack_from('>4sII', profile, 132 + 12 * i)
+        if signature != b'desc':
+            continue
+        tag = profile[offset:offset + size]
+        if tag[:4] == b'desc':
+            length = struct.unpack_from('>I', tag, 8)[0]
+            icc['description'] = _text(tag[12:12 + length])
+        elif tag[:4] == b'mluc':
+            record_offset, = struct.unpack_from('>I', tag, 24)
+            record_length, = struct.unpack_from('>I', tag, 20)
+            icc['description'] = tag[record_offset:record_offset + record_length].decode('utf-16-be', 'replace').strip('\x00 ')
+        break
+    return icc
+
+def ijg_table(base, quality):
+    """The quantization table libjpeg writes for `quality` (1-100)"""
+    scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+    return np.clip((base * scale + 50) // 100, 1, 255)
+
+def summarize_quantization(tables):
+    """Fingerprint JPEG quantization tables and estimate the IJG quality they correspond to
+
+    `tables` maps table ids to 64 values in natural order. The fingerprint
+    identifies the encoder (cameras use their own tables, most software
+    libjpeg's scaled ones); `standard_tables` says whether the tables are
+    exactly libjpeg's at the estimated quality.
+    """
+    if not tables:
+        return None
+    digest = hashlib.sha1()
+    for table_id in sorted(tables):
+        digest.update(bytes([table_id]) + np.asarray(tables[table_id], dtype='>u2').tobytes())
+
+    luminance = np.asarray(tables[min(tables)], dtype=np.float64)
+    scale = luminance.sum() * 100 / IJG_LUMINANCE.sum()
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    quality = int(np.clip(round(quality), 1, 100))
+
+    standard = False
+    # Rounding makes the estimate approximate; check the nearest qualities first
+    for candidate in sorted(range(1, 101), key=lambda q: abs(q - quality)):
+        expected = [ijg_table(IJG_LUMINANCE, candidate), ijg_table(IJG_CHROMINANCE, candidate)]
+        if all(np.array_equal(tables[table_id], expected[min(index, 1)]) for index, table_id in enumerate(sorted(tables))):
+            standard, quality = True, candidate
+            break
+    return {
+        'tables': len(tables),
+        'fingerprint': digest.hexdigest()[:16],
+        'quality_estimate': quality,
+        'standard_tables': standard
+    }
+
+def _parse_dqt(payload, tables):
+    offset = 0
+    while offset < len(payload):
+        precision, table_id = payload[offset] >> 4, payload[offset] & 0x0F
+        size = 128 if precision else 64
+        values = np.frombuffer(payload[offset + 1:offset + 1 + size], dtype='>u2' if precision else np.uint8)
+        if len(values) < 64:
+            break
+        natural = np.empty(64, dtype=np.int64)
+        natural[ZIGZAG] = values
+        tables[table_id] = natural
+        offset += 1 + size
+
+def _parse_sof(payload, marker):
+    height, width, components = struct.unpack_from('>HHB', payload, 1)
+    sampling = payload[7] if components and len(payload) > 7 else 0x11
+    h, v = sampling >> 4, sampling & 0x0F
+    subsampling = {(1, 1): '4:4:4', (2, 1): '4:2:2', (2, 2): '4:2:0', (1, 2): '4:4:0', (4, 1): '4:1:1'}
+    return {
+        'width': width,
+        'height': height,
+        'progressive': marker in (0xC2, 0xC6, 0xCA, 0xCE),
+        'subsampling': subsampling.get((h, v), f'{h}x{v}') if components == 3 else None
+    }
+
+def parse_jpeg(header, info):
+    """Walk the JPEG markers up to the start of scan, reading only the segments used"""
+    tables = {}
+    jpeg = {'progressive': False, 'subsampling': None, 'adobe': False, 'comment': ''}
+    icc_chunks = {}
+    for _ in range(MAX_SEGMENTS):
+        prefix = header.f.read(1)
+        if prefix != b'\xff':
+            break
+        marker = header.f.read(1)
+        while marker == b'\xff':
+            marker = header.f.read(1)
+        if not marker:
+            break
+        marker = marker[0]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        length = header.f.read(2)
+        if len(length) < 2:
+            break
+        size = struct.unpack('>H', length)[0] - 2
+
+        wanted = marker in (0xE1, 0xE2, 0xEE, 0xDB, 0xFE) or (0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC))
+        if not wanted or header.remaining <= 0:
+            header.skip(size)
+            continue
+        payload = header.read(size)
+        if len(payload) < size:
+            header.skip(size - len(payload))
+
+        try:
+            if marker == 0xE1 and payload.startswith(b'Exif\x00\x00'):
+                info['exif'] = parse_exif(payload)
+            elif marker == 0xE1 and payload.startswith(XMP_HEADER):
+                info['xmp'] = parse_xmp(payload[len(XMP_HEADER):])
+            elif marker == 0xE2 and payload.startswith(ICC_HEADER):
+                icc_chunks[payload[12]] = payload[14:]
+            elif marker == 0xEE and payload.startswith(b'Adobe'):
+                jpeg['adobe'] = True
+            elif marker == 0xDB:
+                _parse_dqt(payload, tables)
+            elif marker == 0xFE:
+                jpeg['comment'] = _text(payload[:256])
+            elif 0xC0 <= marker <= 0xCF:
+                frame = _parse_sof(payload, marker)
+                info['width'], info['height'] = frame.pop('width'), frame.pop('height')
+                jpeg.update(frame)
+        except (struct.error, ValueError, IndexError) as e:
+            info['warnings'].append(f'Could not parse JPEG segment 0x{marker:02X}: {str(e)}')
+
+    if icc_chunks:
+        info['icc'] = b''.join(icc_chunks[index] for index in sorted(icc_chunks))
+    jpeg['quantization'] = summarize_quantization(tables)
+    info['jpeg'] = jpeg
+
+def parse_png(header, info):
+    """Read the PNG chunks that precede the image data"""
+    header.skip(8)
+    text = {}
+    for _ in range(MAX_SEGMENTS):
+        chunk = header.f.read(8)
+        if len(chunk) < 8:
+            break
+        size, kind = struct.unpack('>I4s', chunk)
+        # Metadata written after the image data is not read, keeping the cost bounded
+        if kind in (b'IDAT', b'IEND'):
+            break
+        if kind not in (b'IHDR', b'tEXt', b'iTXt', b'zTXt', b'eXIf', b'iCCP', b'tIME') or header.remaining <= 0:
+            header.skip(size + 4)
+            continue
+        payload = header.read(size)
+        header.skip(size - len(payload) + 4)
+
+        try:
+            if kind == b'IHDR':
+                info['width'], info['height'] = struct.unpack_from('>II', payload)
+            elif kind == b'eXIf':
+                info['exif'] = parse_exif(payload)
+            elif kind == b'iCCP':
+                name, _, rest = payload.partition(b'\x00')
+                info['icc'] = zlib.decompressobj().decompress(rest[1:], MAX_HEADER_BYTES)
+            elif kind == b'tIME':
+                year, month, day, hour, minute, second = struct.unpack_from('>HBBBBB', payload)
+                text['Modification Time'] = f'{year:04d}:{month:02d}:{day:02d} {hour:02d}:{minute:02d}:{second:02d}'
+            else:
+                key, _, value = payload.partition(b'\x00')
+                if kind == b'zTXt':
+                    value = zlib.decompressobj().decompress(value[1:], 64 * 1024)
+                elif kind == b'iTXt':
+                    compressed, value = value[0], value[2:]
+                    value = value.split(b'\x00', 2)[-1]
+                    if compressed:
+                        value = zlib.decompressobj().decompress(value, 64 * 1024)
+                key = key.decode('latin-1')
+                if key == 'XML:com.adobe.xmp':
+                    info['xmp'] = parse_xmp(value)
+                elif len(text) < 32:
+                    text[key] = value.decode('utf-8', 'replace')[:256]
+        except (struct.error, ValueError, IndexError, zlib.error) as e:
+            info['warnings'].append(f'Could not parse PNG chunk {kind.decode("latin-1")}: {str(e)}')
+
+    info['software'] = text.get('Software', '')
+    info['text'] = text
+
+def parse_webp(header, info):
+    """Read the WebP RIFF chunks, seeking over the bitstream"""
+    header.skip(12)
+    for _ in range(MAX_SEGMENTS):
+        chunk = header.f.read(8)
+        if len(chunk) < 8:
+            break
+        kind, size = struct.unpack('<4sI', chunk)
+        padded = size + (size & 1)
+        if kind not in (b'VP8X', b'VP8 ', b'VP8L', b'ICCP', b'EXIF', b'XMP ') or header.remaining <= 0:
+            header.skip(padded)
+            continue
+        # Only the frame header of a bitstream chunk is needed
+        wanted = min(size, 16) if kind in (b'VP8 ', b'VP8L') else size
+        payload = header.read(wanted)
+        header.skip(padded - len(payload))
+
+        try:
+            if kind == b'VP8X':
+                info['width'] = int.from_bytes(payload[4:7], 'little') + 1
+                info['height'] = int.from_bytes(payload[7:10], 'little') + 1
+            elif kind == b'VP8 ' and 'width' not in info:
+                width, height = struct.unpack_from('<HH', payload, 6)
+                info['width'], info['height'] = width & 0x3FFF, height & 0x3FFF
+            elif kind == b'VP8L' and 'width' not in info:
+                bits = int.from_bytes(payload[1:5], 'little')
+                info['width'], info['height'] = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            elif kind == b'ICCP':
+                info['icc'] = payload
+            elif kind == b'EXIF':
+                info['exif'] = parse_exif(payload)
+            elif kind == b'XMP ':
+                info['xmp'] = parse_xmp(payload)
+        except (struct.error, ValueError, IndexError) as e:
+            info['warnings'].append(f'Could not parse WebP chunk {kind.decode("latin-1").strip()}: {str(e)}')
+
+def detect_format(signature):
+    if signature.startswith(b'\xff\xd8'):
+        return 'JPEG'
+    if signature.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+        return 'WEBP'
+    if signature[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'TIFF'
+    if signature[:4] == b'GIF8':
+        return 'GIF'
+    if signature[:2] == b'BM':
+        return 'BMP'
+    return 'unknown'
+
+def _thumbnail_size(thumbnail):
+    info = {'warnings': []}
+    parse_jpeg(_Header(io.BytesIO(thumbnail), max_bytes=64 * 1024), info)
+    return info.get('width'), info.get('height')
+
+def editing_software(metadata):
+    """The Software or XMP CreatorTool value naming an image editor, or ''"""
+    tools = [metadata.get('software', ''), (metadata.get('xmp') or {}).get('creator_tool', '')]
+    for tool in tools:
+        if any(name in tool.lower() for name in EDITING_SOFTWARE):
+            return tool
+    return ''
+
+def _forensic_warnings(metadata):
+    """Flag metadata that is typical of an edited image"""
+    warnings = []
+    tool = editing_software(metadata)
+    if tool:
+        warnings.append(f'Saved by image editing software: {tool}')
+    if metadata['datetime'] and metadata['datetime_original'] and metadata['datetime'] != metadata['datetime_original']:
+        warnings.append('Modification date differs from the original capture date')
+    if metadata['exif_dimensions_mismatch']:
+        warnings.append('EXIF pixel dimensions differ from the image dimensions')
+    if metadata['thumbnail'] and metadata['thumbnail']['mismatch']:
+        warnings.append('EXIF thumbnail aspect ratio differs from the image')
+    quantization = (metadata.get('jpeg') or {}).get('quantization')
+    if metadata['make'] and quantization and quantization['standard_tables']:
+        warnings.append('Camera EXIF present but the JPEG uses standard libjpeg tables (re-encoded)')
+    if metadata['make'] and not metadata['has_maker_note'] and metadata['format'] == 'JPEG':
+        warnings.append('Camera EXIF present without a maker note (often stripped by editors)')
+    return warnings
+
+def extract_metadata(source):
+    """Extract forensic metadata from an image path or its encoded bytes
+
+    Only the header segments are read (JPEG APPn/DQT/SOF up to the start of
+    scan, PNG chunks before IDAT, WebP RIFF chunks), at most MAX_HEADER_BYTES
+    in total, so the cost does not depend on the image size. Segments that
+    fail to parse are reported in `warnings` instead of failing the call.
+    """
+    f = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else open(source, 'rb')
+    with f:
+        header = _Header(f)
+        signature = f.read(16)
+        f.seek(0)
+        info = {'warnings': []}
+        image_format = detect_format(signature)
+        if image_format == 'JPEG':
+            parse_jpeg(header, info)
+        elif image_format == 'PNG':
+            parse_png(header, info)
+        elif image_format == 'WEBP':
+            parse_webp(header, info)
+
+    exif = info.get('exif', {})
+    metadata = {
+        'format': image_format,
+        'width': info.get('width'),
+        'height': info.get('height'),
+        'has_exif': 'exif' in info,
+        'make': exif.get('make', ''),
+        'model': exif.get('model', ''),
+        'datetime': exif.get('datetime', ''),
+        'software': exif.get('software') or info.get('software', ''),
+        'datetime_original': exif.get('datetime_original', ''),
+        'datetime_digitized': exif.get('datetime_digitized', ''),
+        'orientation': exif.get('orientation'),
+        'lens_model': exif.get('lens_model', ''),
+        'has_gps': exif.get('has_gps', False),
+        'has_maker_note': exif.get('has_maker_note', False),
+        'exif_dimensions_mismatch': False,
+        'xmp': info.get('xmp'),
+        'icc_profile': None,
+        'thumbnail': None
+    }
+
+    width, height = metadata['width'], metadata['height']
+    exif_width, exif_height = exif.get('exif_width'), exif.get('exif_height')
+    if width and isinstance(exif_width, int) and isinstance(exif_height, int) and exif_width and exif_height:
+        metadata['exif_dimensions_mismatch'] = (exif_width, exif_height) != (width, height)
+
+    if info.get('icc'):
+        try:
+            metadata['icc_profile'] = parse_icc(info['icc'])
+        except (struct.error, ValueError, IndexError) as e:
+            info['warnings'].append(f'Could not parse ICC profile: {str(e)}')
+
+    if exif.get('thumbnail'):
+        thumb_width, thumb_height = _thumbnail_size(exif['thumbnail'])
+        mismatch = False
+        if width and height and thumb_width and thumb_height:
+            # Cameras regenerate the thumbnail on capture; crops made by editors often leave it stale
+            mismatch = abs(thumb_width / thumb_height - width / height) > 0.05 * width / height
+        metadata['thumbnail'] = {'width': thumb_width, 'height': thumb_height, 'mismatch': mismatch}
+
+    if 'jpeg' in info:
+        metadata['jpeg'] = info['jpeg']
+    if 'text' in info:
+        metadata['text'] = info['text']
+    metadata['warnings'] = info['warnings'] + _forensic_warnings(metadata)
+    metadata['header_bytes'] = header.bytes_read
+    metadata['header_truncated'] = header.truncated
+    return metadata
+
+class MetadataCache:
+    """Bounded LRU of extracted metadata keyed by the SHA-256 of the image bytes"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, digest):
+        with self._lock:
+            metadata = self._entries.get(digest)
+            if metadata is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.stats['hits'] += 1
+            return metadata
+
+    def put(self, digest, metadata):
+        with self._lock:
+            self._entries[digest] = metadata
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries)}
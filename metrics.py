@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PIXEL_BUCKETS = (1e5, 3e5, 1e6, 2e6, 5e6, 12e6, 25e6, 50e6, 1e8)
+BYTE_BUCKETS = (1e4, 1e5, 5e5, 1e6, 2e6, 5e6, 1e7, 1.6e7, 5e7)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _Stage:
+    """Context manager timing one stage; see MetricsRegistry.stage"""
+
+    __slots__ = ('registry', 'name', 'timings', 'start')
+
+    def __init__(self, registry, name, timings):
+        self.registry = registry
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.record_stage(self.name, time.perf_counter() - self.start, self.timings)
+        return False
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class MetricsRegistry:
+    """Process-wide stage timings, image sizes and error counts.
+
+    Stages are timed with `stage(name, timings)`; when the registry is
+    disabled and the caller did not ask for a per-request `timings` dict,
+    `stage` hands back a shared no-op context manager so the hot path pays
+    for one attribute check. `render` produces the Prometheus text format.
+    """
+
+    def __init__(self, enabled=True, prefix='forgery'):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def stage(self, name, timings=None):
+        """Time the body of a `with` block as stage `name`
+        
+        If `timings` is a dict the duration is also stored there in ms.
+        """
+        if not self.enabled and timings is None:
+            return _NULL_STAGE
+        return _Stage(self, name, timings)
+
+    def record_stage(self, name, seconds, timings=None):
+        """Record a stage duration measured elsewhere (e.g. in a worker)"""
+        if timings is not None:
+            timings[name] = round(seconds * 1000, 3)
+        self.observe('stage_seconds', seconds, STAGE_BUCKETS, stage=name)
+
+    def observe(self, name, value, buckets, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe_image(self, pixels, size_bytes):
+        self.observe('image_pixels', pixels, PIXEL_BUCKETS)
+        self.observe('image_bytes', size_bytes, BYTE_BUCKETS)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of every metric, plus optional {name: value} gauges"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            snapshot = [(key, histogram.buckets, list(histogram.counts), histogram.sum, histogram.count)
+                        for key, histogram in histograms]
+
+        typed = set()
+        for (name, labels), buckets, counts, total, count in snapshot:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value}")
+
+        for name, value in sorted((gauges or {}).items()):
+            # Not known yet (e.g. the disk cache size before its first scan); Prometheus has no null
+            if value is None:
+                continue
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return '\n'.join(lines) + '\n'
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def timed_call(func, *args):
+    """Run func(*args) and return (result, seconds); used for stages run in a pool"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+# Shared by the app, the pipeline and the analysis helpers
+metrics = MetricsRegistry()
@@ -0,0 +1,169 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+
+def _pack(bits):
+    """64 booleans to an unsigned integer, first bit most significant"""
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _signed(value):
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def _unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+def phash(gray):
+    """64-bit DCT perceptual hash: the signs of the 8x8 lowest frequencies of a 32x32 copy against their median"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # The DC term only encodes brightness; leave it out of the median
+    return _pack(low > np.median(low[1:]))
+
+def dhash(gray):
+    """64-bit difference hash: whether each pixel of a 9x8 copy is brighter than its left neighbour"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+def gray_hashes(gray):
+    """(phash, dhash) of a grayscale array of any size"""
+    return phash(gray), dhash(gray)
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+def chunks(value):
+    """Split a 64-bit hash into CHUNKS integers of CHUNK_BITS bits, most significant first"""
+    mask = (1 << CHUNK_BITS) - 1
+    return [(value >> (CHUNK_BITS * (CHUNKS - 1 - i))) & mask for i in range(CHUNKS)]
+
+def chunk_probes(chunk, radius):
+    """Every CHUNK_BITS-bit value within `radius` bit flips of `chunk`"""
+    probes = [chunk]
+    for flips in range(1, radius + 1):
+        for bits in itertools.combinations(range(CHUNK_BITS), flips):
+            value = chunk
+            for bit in bits:
+                value ^= 1 << bit
+            probes.append(value)
+    return probes
+
+class PerceptualHashIndex:
+    """Near-duplicate lookup over the perceptual hashes of analyzed images.
+
+    Each image is stored with its pHash, split into four 16-bit chunks that
+    are indexed separately (multi-index hashing). Two hashes within
+    `radius` bits of each other agree to within radius // 4 bits on at
+    least one chunk, so a lookup only probes the chunk values that close to
+    the query's and checks the handful of rows found there, instead of
+    scanning the table. Candidates must also be within `dhash_radius` on
+    the dHash, which weeds out pHash collisions. The index lives in a
+    SQLite database (WAL mode, one connection per thread and process) and
+    keeps the most recent `max_entries` images.
+    """
+
+    def __init__(self, path, radius=6, dhash_radius=12, max_entries=5000000):
+        self.path = path
+        self.radius = radius
+        self.dhash_radius = dhash_radius
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.stats = {'lookups': 0, 'matches': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                'id INTEGER PRIMARY KEY, digest TEXT UNIQUE NOT NULL, result_id TEXT NOT NULL, '
+                'phash INTEGER NOT NULL, dhash INTEGER NOT NULL, '
+                'c0 INTEGER NOT NULL, c1 INTEGER NOT NULL, c2 INTEGER NOT NULL, c3 INTEGER NOT NULL, '
+                'created REAL NOT NULL)'
+            )
+            for i in range(CHUNKS):
+                connection.execute(f'CREATE INDEX IF NOT EXISTS hashes_c{i} ON hashes (c{i})')
+            # Row count kept by triggers, so /metrics does not scan the table
+            connection.execute('CREATE TABLE IF NOT EXISTS counts (id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL)')
+            connection.execute('INSERT OR IGNORE INTO counts SELECT 0, COUNT(*) FROM hashes')
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS hashes_insert AFTER INSERT ON hashes '
+                'BEGIN UPDATE counts SET entries = entries + 1; END'
+            )
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS hashes_delete AFTER DELETE ON hashes '
+                'BEGIN UPDATE counts SET entries = entries - 1; END'
+            )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # Rows that INSERT OR REPLACE deletes only fire the delete trigger with this on
+            connection.execute('PRAGMA recursive_triggers=ON')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, digest, hashes, result_id):
+        """Record the hashes of the image with SHA-256 `digest`, analyzed as `result_id`"""
+        p, d = hashes
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO hashes (digest, result_id, phash, dhash, c0, c1, c2, c3, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (digest, result_id, _signed(p), _signed(d), *chunks(p), time.time())
+            )
+            # Row ids grow with insertion, so this keeps the newest max_entries
+            connection.execute(
+                'DELETE FROM hashes WHERE id <= (SELECT MAX(id) FROM hashes) - ?',
+                (self.max_entries,)
+            )
+
+    def find(self, hashes, exclude_digest=None):
+        """Closest indexed image within the search radius of `hashes`
+
+        Returns {'digest', 'result_id', 'distance', 'dhash_distance'} or
+        None. The entry for `exclude_digest` (the query image itself) is
+        skipped.
+        """
+        p, d = hashes
+        connection = self._connection()
+        probe_radius = self.radius // CHUNKS
+        best = None
+        seen = set()
+        for i, chunk in enumerate(chunks(p)):
+            probes = chunk_probes(chunk, probe_radius)
+            rows = connection.execute(
+                f'SELECT digest, result_id, phash, dhash FROM hashes WHERE c{i} IN ({",".join("?" * len(probes))})',
+                probes
+            )
+            for digest, result_id, candidate_p, candidate_d in rows:
+                if digest in seen or digest == exclude_digest:
+                    continue
+                seen.add(digest)
+                distance = hamming(p, _unsigned(candidate_p))
+                dhash_distance = hamming(d, _unsigned(candidate_d))
+                if distance > self.radius or dhash_distance > self.dhash_radius:
+                    continue
+                if best is None or (distance, dhash_distance) < (best['distance'], best['dhash_distance']):
+                    best = {'digest': digest, 'result_id': result_id, 'distance': distance, 'dhash_distance': dhash_distance}
+        self.stats['lookups'] += 1
+        self.stats['matches'] += best is not None
+        return best
+
+    def get_stats(self):
+        entries = self._connection().execute('SELECT entries FROM counts').fetchone()[0]
+        return {**self.stats, 'entries': entries}
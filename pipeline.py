@@ -0,0 +1,102 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from image_context import as_image_context
+from metrics import metrics, timed_call
+from ml_detection import (
+    analyze_cloning,
+    analyze_compression,
+    analyze_region_statistics,
+    merge_forgery_results,
+    predict_heatmap,
+    predict_ml,
+)
+
+class PipelineExecutor:
+    """Run the independent analysis stages of a request concurrently.
+
+    The DCT compression check, SIFT cloning check, contour region analysis
+    and CNN inference do not depend on each other, and OpenCV and torch
+    release the GIL, so a request takes roughly as long as its slowest stage.
+    With `use_processes` the classical stages run in a process pool (they
+    only need the grayscale array); CNN inference always stays in this
+    process, next to the loaded model. The pools are created on the first
+    request in each process, so an executor built in the gunicorn master
+    before it forks works in every worker.
+    """
+
+    def __init__(self, max_workers=4, use_processes=False):
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self._threads = None
+        self._processes = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Pools inherited through fork have no live threads or workers; build new ones
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline')
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers) if self.use_processes else None
+                self._pid = os.getpid()
+
+    def run(self, image, model, copy_move_mode='accurate', timings=None, tiling=None):
+        """Analyze an image path or ImageContext
+
+        Returns a (forgery_detection, region_analysis) pair with the same
+        schema as detect_forgery_ml and analyze_image_regions. Stage times
+        go to the metrics registry and, if given, the `timings` dict. With
+        `tiling` set, the sliding-window heatmap runs as one more stage.
+        """
+        ctx = as_image_context(image)
+        if ctx is None:
+            error = {'error': 'Could not read image'}
+            return error, error
+        self._ensure_running()
+
+        # Start the CNN first; it does not need the grayscale view
+        ml_future = None if model is None else self._threads.submit(timed_call, predict_ml, ctx, model)
+        heatmap_future = None
+        if model is not None and tiling is not None:
+            heatmap_future = self._threads.submit(timed_call, predict_heatmap, ctx, model, tiling)
+
+        with metrics.stage('grayscale', timings):
+            gray = ctx.gray
+        classical = self._processes or self._threads
+        compression_future = classical.submit(timed_call, analyze_compression, gray)
+        cloning_future = classical.submit(timed_call, analyze_cloning, gray, copy_move_mode)
+        regions_future = classical.submit(timed_call, analyze_region_statistics, gray)
+
+        try:
+            region_analysis = self._result('regions', regions_future, timings)
+        except Exception as e:
+            region_analysis = {'error': str(e)}
+
+        try:
+            forgery_detection = merge_forgery_results(
+                self._result('dct', compression_future, timings),
+                self._result('copy_move', cloning_future, timings),
+                None if ml_future is None else self._result('cnn', ml_future, timings),
+                None if heatmap_future is None else self._result('heatmap', heatmap_future, timings)
+            )
+        except Exception as e:
+            forgery_detection = {'error': str(e)}
+
+        return forgery_detection, region_analysis
+
+    @staticmethod
+    def _result(stage, future, timings):
+        result, seconds = future.result()
+        metrics.record_stage(stage, seconds, timings)
+        return result
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        self._threads.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
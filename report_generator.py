@@ -5,15 +5,87 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from PIL import Image as PILImage
+import cv2
+import io
+import numpy as np
 import os
 from datetime import datetime
 
+# Styles are immutable once built, so every report shares them
+styles = getSampleStyleSheet()
+title_style = ParagraphStyle(
+    'CustomTitle',
+    parent=styles['Heading1'],
+    fontSize=24,
+    spaceAfter=30
+)
+
+def _table_style(header_font_size, body_font_size):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), body_font_size),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+summary_table_style = _table_style(14, 12)
+region_table_style = _table_style(12, 10)
+
+def _load_thumbnail(image, max_side):
+    """Decode an image (a path or the encoded bytes) at most `max_side` pixels on its longer side
+    
+    JPEGs are decoded at a reduced DCT scale (PIL draft mode), so large
+    photos are never fully decoded.
+    """
+    with PILImage.open(io.BytesIO(image) if isinstance(image, bytes) else image) as img:
+        img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), PILImage.LANCZOS)
+    return img
+
+def _jpeg_buffer(img, quality):
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    buffer.seek(0)
+    return buffer, img.width, img.height
+
+def make_thumbnail(image, max_side=1024, quality=80):
+    """Downscale an image (a path or the encoded bytes) to a JPEG thumbnail; return (buffer, width, height)"""
+    return _jpeg_buffer(_load_thumbnail(image, max_side), quality)
+
+def make_heatmap_overlay(image, heatmap, max_side=768, quality=80, alpha=0.45):
+    """Blend a forgery heatmap (rows of probabilities) over a thumbnail of the image
+    
+    Without an image the colour-mapped heatmap is drawn on its own.
+    Returns (buffer, width, height) of a JPEG.
+    """
+    values = np.asarray(heatmap, dtype=np.float32)
+    if image is not None:
+        base = np.asarray(_load_thumbnail(image, max_side))
+    else:
+        factor = max_side / max(values.shape)
+        base = np.full((max(1, int(values.shape[0] * factor)), max(1, int(values.shape[1] * factor)), 3), 128, np.uint8)
+    height, width = base.shape[:2]
+    heat = cv2.resize(values, (width, height), interpolation=cv2.INTER_LINEAR)
+    heat = cv2.applyColorMap(np.uint8(np.clip(heat, 0, 1) * 255), cv2.COLORMAP_JET)
+    heat = cv2.cvtColor(heat, cv2.COLOR_BGR2RGB)
+    blended = cv2.addWeighted(base, 1 - alpha, heat, alpha, 0) if image is not None else heat
+    return _jpeg_buffer(PILImage.fromarray(blended), quality)
+
 def generate_report(image_path, analysis_results, output_path):
     """
     Generate a PDF report for image forgery analysis
     
     Args:
-        image_path (str): Path to the analyzed image
+        image_path (str or bytes): Path to the analyzed image, or its encoded bytes
         analysis_results (dict): Results from the forgery analysis
         output_path (str): Path where the PDF should be saved
     """
@@ -30,15 +102,6 @@ def generate_report(image_path, analysis_results, output_path):
     # Container for PDF elements
     elements = []
     
-    # Get styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30
-    )
-    
     # Add title
     elements.append(Paragraph("Image Forgery Detection Report", title_style))
     elements.append(Spacer(1, 12))
@@ -47,9 +110,12 @@ def generate_report(image_path, analysis_results, output_path):
     elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
     elements.append(Spacer(1, 12))
     
-    # Add image
-    if os.path.exists(image_path):
-        img = Image(image_path, width=4*inch, height=3*inch)
+    # Add a downscaled copy of the image, fitted into a 4x3 inch box
+    has_image = isinstance(image_path, bytes) or bool(image_path and os.path.exists(image_path))
+    if has_image:
+        thumbnail, width, height = make_thumbnail(image_path)
+        scale = min(4*inch / width, 3*inch / height)
+        img = Image(thumbnail, width=width * scale, height=height * scale)
         elements.append(img)
         elements.append(Spacer(1, 12))
     
@@ -65,21 +131,21 @@ def generate_report(image_path, analysis_results, output_path):
             ["Date/Time", metadata.get('datetime', 'N/A')],
             ["Software", metadata.get('software', 'N/A')]
         ]
+        if metadata.get('format'):
+            metadata_data.append(["Format", f"{metadata['format']} {metadata.get('width')}x{metadata.get('height')}"])
+            metadata_data.append(["Original Date/Time", metadata.get('datetime_original') or 'N/A'])
+            metadata_data.append(["GPS Location", str(metadata.get('has_gps', 'N/A'))])
+        quantization = (metadata.get('jpeg') or {}).get('quantization')
+        if quantization:
+            metadata_data.append(["JPEG Quality (est.)", f"{quantization['quality_estimate']} ({'standard' if quantization['standard_tables'] else 'custom'} tables)"])
+            metadata_data.append(["Quantization Fingerprint", quantization['fingerprint']])
+        if metadata.get('thumbnail'):
+            metadata_data.append(["EXIF Thumbnail Mismatch", str(metadata['thumbnail']['mismatch'])])
         metadata_table = Table(metadata_data, colWidths=[2*inch, 3*inch])
-        metadata_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        metadata_table.setStyle(summary_table_style)
         elements.append(metadata_table)
+        for warning in metadata.get('warnings', []):
+            elements.append(Paragraph(f"Warning: {warning}", styles['Normal']))
     elements.append(Spacer(1, 12))
     
     # Add forgery detection results
@@ -92,21 +158,29 @@ def generate_report(image_path, analysis_results, output_path):
             ["Compression Artifacts", str(forgery.get('compression_artifacts', 'N/A'))],
             ["Suspicious Regions", str(forgery.get('suspicious_regions', 'N/A'))]
         ]
+        if 'tier' in analysis_results:
+            forgery_data.append(["Analysis Tier", 'Triage screening' if analysis_results['tier'] == 'triage' else 'Full analysis'])
+        if 'downscaled' in analysis_results:
+            downscaled = analysis_results['downscaled']
+            forgery_data.append(["Analyzed At", f"1/{downscaled['factor']} scale ({downscaled['width']}x{downscaled['height']})"])
         forgery_table = Table(forgery_data, colWidths=[2*inch, 3*inch])
-        forgery_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        forgery_table.setStyle(summary_table_style)
         elements.append(forgery_table)
+        
+        # Add the sliding-window heatmap when tiled inference was requested
+        heatmap = forgery.get('heatmap')
+        if heatmap and heatmap.get('values'):
+            elements.append(Spacer(1, 12))
+            elements.append(Paragraph("Tampering Heatmap", styles['Heading2']))
+            overlay, width, height = make_heatmap_overlay(image_path if has_image else None, heatmap['values'])
+            scale = min(4*inch / width, 3*inch / height)
+            elements.append(Image(overlay, width=width * scale, height=height * scale))
+            elements.append(Paragraph(
+                f"{heatmap['tiles']} tiles of {heatmap['tile']}px (stride {heatmap['stride']}px); "
+                f"highest tile probability {heatmap['max_probability']:.2f}, mean {heatmap['mean_probability']:.2f}. "
+                "Red marks tiles the model considers likely manipulated.",
+                styles['Normal']
+            ))
     elements.append(Spacer(1, 12))
     
     # Add region analysis
@@ -125,19 +199,7 @@ def generate_report(image_path, analysis_results, output_path):
                 f"{stats['entropy']:.2f}"
             ])
         region_table = Table(region_data, colWidths=[0.5*inch, 1.5*inch, inch, inch, inch])
-        region_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        region_table.setStyle(region_table_style)
         elements.append(region_table)
     
     # Add conclusion
@@ -165,4 +227,4 @@ def generate_report(image_path, analysis_results, output_path):
     # Build the PDF
     doc.build(elements)
     
-    return output_path 
\ No newline at end of file
+    return output_path
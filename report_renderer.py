@@ -0,0 +1,137 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from memory_governor import estimate_thumbnail, image_dimensions
+
+# Identifies the layout produced by report_generator. Bump it whenever the
+# PDF contents change so cached reports are rendered again.
+REPORT_VERSION = 'v4'
+
+class ReportRenderer:
+    """Render PDF reports in the background and keep them on disk.
+
+    Reports are stored as report_<result_id>_<REPORT_VERSION>.pdf, so a
+    repeat download streams the stored file, and a result rendered by one
+    worker process is reused by the others. `submit` starts rendering as
+    on demand; `get` waits for (or starts) the render. `prerender` starts
+    one in the background after an analysis, unless `max_backlog` renders
+    are already queued or running, in which case the report is left to be
+    rendered when it is requested. Only the `max_reports` most recent files
+    are kept. With a `governor`
+    (MemoryGovernor), decoding the image for the thumbnails is charged to
+    its budget like an analysis.
+    """
+
+    def __init__(self, reports_dir, workers=1, max_reports=1000, governor=None, max_backlog=8):
+        self.reports_dir = reports_dir
+        self.max_reports = max_reports
+        self.governor = governor
+        self.max_backlog = max_backlog
+        self.stats = {'prerendered': 0, 'prerenders_skipped': 0}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+        self._pending = {}
+        self._lock = threading.Lock()
+        os.makedirs(reports_dir, exist_ok=True)
+
+    def report_path(self, result_id):
+        return os.path.join(self.reports_dir, f"report_{result_id}_{REPORT_VERSION}.pdf")
+
+    def submit(self, result_id, image_path, analysis_results):
+        """Start rendering the report unless it exists or is already being rendered
+        
+        Returns a Future for the report path.
+        """
+        with self._lock:
+            return self._pending.get(result_id) or self._start(result_id, image_path, analysis_results)
+
+    def prerender(self, result_id, image_path, analysis_results):
+        """Render the report in the background unless the backlog is full
+        
+        `image_path` should be the persisted upload rather than its bytes,
+        so a queued render holds no image in memory. Returns a Future for
+        the report path, or None if the render was skipped.
+        """
+        with self._lock:
+            future = self._pending.get(result_id)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.max_backlog:
+                self.stats['prerenders_skipped'] += 1
+                return None
+            self.stats['prerendered'] += 1
+            return self._start(result_id, image_path, analysis_results)
+
+    def _start(self, result_id, image_path, analysis_results):
+        # Called with self._lock held
+        future = self._executor.submit(self._render, result_id, image_path, analysis_results)
+        self._pending[result_id] = future
+        future.add_done_callback(lambda _: self._forget(result_id))
+        return future
+
+    def get(self, result_id, image_path, analysis_results, timeout=None):
+        """Return the path of the rendered report, rendering it first if needed"""
+        path = self.report_path(result_id)
+        if os.path.exists(path):
+            return path
+        return self.submit(result_id, image_path, analysis_results).result(timeout)
+
+    def _forget(self, result_id):
+        with self._lock:
+            self._pending.pop(result_id, None)
+
+    def _render(self, result_id, image_path, analysis_results):
+        # reportlab is only needed once a report is rendered; keep it off the startup path
+        from report_generator import generate_report
+        
+        path = self.report_path(result_id)
+        if os.path.exists(path):
+            return path
+        # Render next to the final name and rename, so readers never see a partial PDF
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        reserved = self._reserve(image_path, analysis_results)
+        try:
+            generate_report(image_path, analysis_results, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if reserved:
+                self.governor.release(reserved)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._prune()
+        return path
+
+    def _reserve(self, image_path, analysis_results):
+        """Reserve the memory of decoding the report's image; return the bytes reserved"""
+        if self.governor is None or not image_path:
+            return 0
+        metadata = analysis_results.get('metadata') or {}
+        dimensions = image_dimensions(image_path, metadata)
+        if dimensions is None:
+            return 0
+        nbytes = min(estimate_thumbnail(*dimensions, jpeg=metadata.get('format') == 'JPEG'), self.governor.budget_bytes)
+        if not self.governor.acquire(nbytes):
+            raise RuntimeError('Server is busy, retry later')
+        return nbytes
+
+    def _prune(self):
+        """Delete the oldest cached reports beyond `max_reports`"""
+        reports = []
+        for entry in os.scandir(self.reports_dir):
+            if entry.name.startswith('report_') and entry.name.endswith(f"_{REPORT_VERSION}.pdf"):
+                reports.append((entry.stat().st_mtime, entry.path))
+        if len(reports) <= self.max_reports:
+            return
+        reports.sort()
+        for _, path in reports[:len(reports) - self.max_reports]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'backlog': len(self._pending), 'max_backlog': self.max_backlog}
+
+    def shutdown(self):
+        self._executor.shutdown()
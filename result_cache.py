@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+def content_hash(data):
+    """SHA-256 hex digest of the uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+class ResultCache:
+    """Content-addressed cache for analysis results.
+
+    Entries are keyed by the SHA-256 of the uploaded bytes plus a version key
+    naming the analyzers/model that produced them. Lookups go to a bounded
+    in-memory LRU first and then to an on-disk tier that survives restarts.
+    The disk tier evicts entries older than `ttl` seconds and the oldest
+    entries once it grows past `max_disk_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_memory_entries=256, max_disk_bytes=512 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'expired': 0
+        }
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(digest, version):
+        return f"{digest}-{version}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached result for `key`, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self.stats['expired'] += 1
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+            self._remember(key, value, now)
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serializable result under `key` in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        self._write_disk(key, value)
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (stored_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.stats['memory_evictions'] += 1
+
+    def _read_disk(self, key, now):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                self._remove(path)
+                with self._lock:
+                    self.stats['expired'] += 1
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing result cache entry: {str(e)}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += os.path.getsize(path)
+            needs_eviction = self._disk_bytes is None or self._disk_bytes > self.max_disk_bytes
+        if needs_eviction:
+            self.evict_disk()
+
+    def evict_disk(self):
+        """Drop expired entries, then the oldest ones until the disk tier fits its size limit"""
+        if not self.cache_dir:
+            return
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._remove(entry.path)
+                with self._lock:
+                    self.stats['expired'] += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self.stats['disk_evictions'] += evicted
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get_stats(self):
+        """Hit, miss and eviction counters plus the current size of each tier"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_bytes'] = self._disk_bytes
+        stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+        return stats
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def make_result_id(cache_key):
+    """Stable id for a stored result: same bytes and analysis settings, same id"""
+    return hashlib.sha256(cache_key.encode('utf-8')).hexdigest()[:32]
+
+class MemoryResultsStore:
+    """Bounded in-process LRU of analysis results keyed by result id.
+
+    Only visible to the process that wrote it; use SQLiteResultsStore when
+    several gunicorn workers must see each other's results.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    def get(self, result_id):
+        """Return the stored result for `result_id`, or None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[result_id]
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(result_id)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, result_id, value):
+        with self._lock:
+            self._entries[result_id] = (time.time(), value)
+            self._entries.move_to_end(result_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries)}
+
+class SQLiteResultsStore:
+    """Analysis results in a SQLite database shared by every worker process.
+
+    The database runs in WAL mode so readers do not block the writer.
+    Rows older than `ttl` seconds are dropped, and once more than
+    `max_entries` rows exist the least recently read ones are evicted;
+    both deletions go through indexes. Each thread uses its own connection,
+    and connections opened before a fork are not reused in the child.
+    """
+
+    def __init__(self, path, max_entries=100000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self.stats = {'hits': 0, 'misses': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'result_id TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL, data TEXT NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+            connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, result_id):
+        """Return the stored result for `result_id`, or None"""
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT data FROM results WHERE result_id = ? AND created >= ?',
+            (result_id, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        with connection:
+            connection.execute('UPDATE results SET accessed = ? WHERE result_id = ?', (now, result_id))
+        self.stats['hits'] += 1
+        return json.loads(row[0])
+
+    def put(self, result_id, value):
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO results (result_id, created, accessed, data) VALUES (?, ?, ?, ?)',
+                (result_id, now, now, json.dumps(value))
+            )
+            connection.execute('DELETE FROM results WHERE created < ?', (now - self.ttl,))
+            connection.execute(
+                'DELETE FROM results WHERE result_id IN '
+                '(SELECT result_id FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def get_stats(self):
+        entries = self._connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return {**self.stats, 'entries': entries}
+
+def create_results_store(backend='sqlite', path=None, max_entries=1024, ttl=24 * 3600):
+    """Build the results store named by `backend` ('sqlite' or, for a single process, 'memory')"""
+    if backend == 'sqlite':
+        return SQLiteResultsStore(path, max_entries=max_entries, ttl=ttl)
+    if backend == 'memory':
+        return MemoryResultsStore(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f'Unknown results store backend: {backend}')
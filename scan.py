@@ -0,0 +1,152 @@
+"""Analyze every image under a directory tree and write the results as JSONL.
+
+Images are spread over a process pool; each worker loads the model once.
+The output file doubles as the checkpoint: rerunning the same command skips
+every path already recorded there, so an interrupted scan picks up where it
+stopped. Does not import Flask.
+
+Usage:
+    python scan.py /data/archive results.jsonl --workers 8 --mode fast
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+
+from analysis import run_analysis
+from copy_move import COPY_MOVE_MODES
+from ml_detection import ANALYSIS_VERSION, INFERENCE_BACKENDS, MODEL_HEADS, load_model, optimize_model
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+
+# Per-process state set up by _init_worker
+_model = None
+_mode = 'accurate'
+_tiling = None
+_triage = None
+
+def _init_worker(mode, threads, head, backend, channels_last, tiling, triage):
+    """Load the model once per worker process"""
+    global _model, _mode, _tiling, _triage
+    # Workers already run in parallel; keep each one from spawning its own thread pool
+    cv2.setNumThreads(threads)
+    _mode = mode
+    _tiling = tiling
+    _triage = triage
+    try:
+        _model = optimize_model(load_model(head), backend=backend, channels_last=channels_last, num_threads=threads)
+    except Exception as e:
+        print(f"Error loading ML model: {str(e)}", file=sys.stderr)
+        _model = None
+
+def analyze_file(path):
+    """Analyze one image; return its JSONL record"""
+    try:
+        analysis = run_analysis(path, None, _model, _mode, tiling=_tiling, triage=_triage)
+    except Exception as e:
+        analysis = {'error': str(e)}
+    if 'error' in analysis:
+        return {'path': path, 'mode': _mode, 'version': ANALYSIS_VERSION, 'error': analysis['error']}
+    return {'path': path, 'mode': _mode, 'version': ANALYSIS_VERSION, **analysis}
+
+def find_images(root):
+    """Yield the paths of image files under `root`, in a stable order"""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                yield os.path.join(directory, filename)
+
+def load_checkpoint(output_path, retry_errors=False):
+    """Return the set of paths already recorded in `output_path`
+    
+    The file is read one record at a time, so only the paths are kept in
+    memory. A crash can leave a partial last line; it is cut off so that
+    appended records stay valid JSONL.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'rb+') as output:
+        end = 0
+        for line in output:
+            if not line.endswith(b'\n'):
+                break
+            end += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if retry_errors and 'error' in record:
+                continue
+            done.add(record['path'])
+        if output.seek(0, os.SEEK_END) > end:
+            output.truncate(end)
+    return done
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+def report_progress(done, total, failed, started):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed > 0 else 0.0
+    eta = format_duration((total - done) / rate) if rate > 0 else '?'
+    sys.stderr.write(f"\r{done}/{total} images  {failed} failed  {rate:.2f} images/s  ETA {eta}  ")
+    sys.stderr.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='Directory to scan recursively')
+    parser.add_argument('output', help='JSONL file to append results to (also the resume checkpoint)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--mode', choices=sorted(COPY_MOVE_MODES), default='accurate')
+    parser.add_argument('--head', choices=sorted(MODEL_HEADS), default='flatten')
+    parser.add_argument('--backend', choices=INFERENCE_BACKENDS, default='eager')
+    parser.add_argument('--channels-last', action='store_true')
+    parser.add_argument('--tiled', action='store_true', help='Add a sliding-window forgery heatmap')
+    parser.add_argument('--tile-stride', type=int, default=112)
+    parser.add_argument('--max-tiles', type=int, default=256)
+    parser.add_argument('--triage', action='store_true', help='Screen images cheaply; analyze in full only above the threshold')
+    parser.add_argument('--triage-threshold', type=float, default=0.6)
+    parser.add_argument('--chunksize', type=int, default=4)
+    parser.add_argument('--retry-errors', action='store_true', help='Re-analyze paths that failed previously')
+    args = parser.parse_args()
+
+    done = load_checkpoint(args.output, args.retry_errors)
+    paths = [path for path in find_images(args.root) if path not in done]
+    print(f"{len(done)} images already in {args.output}, {len(paths)} to scan", file=sys.stderr)
+    if not paths:
+        return
+
+    started = time.monotonic()
+    last_report = 0.0
+    failed = 0
+    with open(args.output, 'a') as output, multiprocessing.Pool(
+        args.workers,
+        initializer=_init_worker,
+        initargs=(
+            args.mode, args.threads_per_worker, args.head, args.backend, args.channels_last,
+            {'stride': args.tile_stride, 'max_tiles': args.max_tiles} if args.tiled else None,
+            {'threshold': args.triage_threshold} if args.triage else None
+        )
+    ) as pool:
+        for count, record in enumerate(pool.imap_unordered(analyze_file, paths, args.chunksize), 1):
+            output.write(json.dumps(record) + '\n')
+            # Flush every record so a crash loses at most the images in flight
+            output.flush()
+            failed += 'error' in record
+            now = time.monotonic()
+            if now - last_report >= 1.0 or count == len(paths):
+                report_progress(count, len(paths), failed, started)
+                last_report = now
+    sys.stderr.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+import torch
+
+from inference_engine import InferenceEngine
+
+TILE = 224
+
+# Same normalization as ml_detection.transform, applied to raw pixel tiles
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255
+
+def tile_positions(length, tile=TILE, stride=TILE // 2):
+    """Start offsets of tiles covering `length` pixels; the last tile is flush with the edge"""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] != length - tile:
+        positions.append(length - tile)
+    return positions
+
+def _fit_image(rgb, tile, stride, max_tiles):
+    """Pad images smaller than a tile and downscale ones that would need more than `max_tiles` tiles
+
+    Returns (image, scale, content_shape): `scale` maps analysed pixels back to
+    the original and `content_shape` is the analysed size before padding.
+    """
+    height, width = rgb.shape[:2]
+    scale = 1.0
+    count = len(tile_positions(height, tile, stride)) * len(tile_positions(width, tile, stride))
+    if max_tiles and count > max_tiles:
+        scale = (count / max_tiles) ** 0.5
+        size = (max(tile, int(width / scale)), max(tile, int(height / scale)))
+        rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
+        scale = width / size[0]
+    height, width = rgb.shape[:2]
+    if height < tile or width < tile:
+        rgb = cv2.copyMakeBorder(rgb, 0, max(tile - height, 0), 0, max(tile - width, 0), cv2.BORDER_REFLECT_101)
+    return rgb, scale, (height, width)
+
+def _iter_batches(rgb, ys, xs, tile, batch_size):
+    """Yield (positions, tensor) batches, cutting tiles only as each batch is needed"""
+    positions = [(y, x) for y in ys for x in xs]
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        tiles = np.stack([rgb[y:y + tile, x:x + tile] for y, x in batch]).astype(np.float32)
+        tiles -= MEAN
+        tiles /= STD
+        yield batch, torch.from_numpy(tiles).permute(0, 3, 1, 2)
+
+def _predict(model, tensor):
+    """Forgery probabilities for a batch of tiles"""
+    if isinstance(model, InferenceEngine):
+        # One submission per tile, so tiles share the engine's forward passes with other requests
+        futures = [model.submit(tensor[i:i + 1]) for i in range(len(tensor))]
+        return np.array([future.result() for future in futures], dtype=np.float32)
+    with torch.no_grad():
+        return torch.softmax(model(tensor), dim=1)[:, 1].numpy()
+
+def tiled_heatmap(rgb, model, stride=TILE // 2, batch_size=16, cell=8, max_tiles=1024, max_side=64):
+    """Sliding-window forgery probabilities for an RGB array
+
+    Overlapping TILExTILE tiles are cut `batch_size` at a time, run through
+    the model (or queued on an InferenceEngine) and accumulated into a
+    probability map at 1/`cell` of the analysed resolution, averaging
+    wherever tiles overlap. Only one batch of tiles and the reduced map are
+    held in memory. Images needing more than `max_tiles` tiles are
+    downscaled first; `scale`, `effective_tile` and `effective_stride` in
+    the result give the tiling in original pixels.
+
+    Returns a JSON-friendly dict; `values` is the map resized so its longer
+    side is at most `max_side`, with rows top to bottom.
+    """
+    rgb, scale, (content_height, content_width) = _fit_image(rgb, TILE, stride, max_tiles)
+    height, width = rgb.shape[:2]
+    ys = tile_positions(height, TILE, stride)
+    xs = tile_positions(width, TILE, stride)
+
+    map_height, map_width = -(-height // cell), -(-width // cell)
+    totals = np.zeros((map_height, map_width), dtype=np.float32)
+    counts = np.zeros((map_height, map_width), dtype=np.float32)
+    tile_probabilities = []
+    for batch, tensor in _iter_batches(rgb, ys, xs, TILE, batch_size):
+        probabilities = _predict(model, tensor)
+        tile_probabilities.append(probabilities)
+        for (y, x), probability in zip(batch, probabilities):
+            cells = (slice(y // cell, -(-(y + TILE) // cell)), slice(x // cell, -(-(x + TILE) // cell)))
+            totals[cells] += probability
+            counts[cells] += 1
+
+    # Average overlapping tiles and drop the padding added to small images
+    heatmap = totals / np.maximum(counts, 1)
+    heatmap = heatmap[:-(-content_height // cell), :-(-content_width // cell)]
+    factor = min(1.0, max_side / max(heatmap.shape))
+    size = (max(1, round(heatmap.shape[1] * factor)), max(1, round(heatmap.shape[0] * factor)))
+    values = cv2.resize(heatmap, size, interpolation=cv2.INTER_AREA)
+    tile_probabilities = np.concatenate(tile_probabilities)
+    return {
+        'tile': TILE,
+        'stride': stride,
+        'tiles': int(tile_probabilities.size),
+        'scale': float(scale),
+        'effective_tile': round(TILE * scale),
+        'effective_stride': round(stride * scale),
+        'max_probability': float(tile_probabilities.max()),
+        'mean_probability': float(tile_probabilities.mean()),
+        'values': np.round(values, 3).tolist()
+    }
@@ -0,0 +1,86 @@
+import cv2
+
+from jpeg_grid import BLOCK
+from metadata import editing_software
+from ml_detection import analyze_cloning, analyze_compression, merge_forgery_results, predict_ml
+from regions import region_statistics, scale_regions
+
+def center_crop(gray, size):
+    """Native-resolution crop of at most `size` x `size` pixels from the middle of the image
+
+    The crop starts on a multiple of 8 pixels so the JPEG block grid keeps
+    the same phase as in the full image.
+    """
+    height, width = gray.shape[:2]
+    top = max(0, (height - size) // 2) // BLOCK * BLOCK
+    left = max(0, (width - size) // 2) // BLOCK * BLOCK
+    return gray[top:top + size, left:left + size]
+
+def downscale(gray, max_side):
+    """Shrink a grayscale image so its longer side is at most `max_side`; return (image, scale)"""
+    height, width = gray.shape[:2]
+    scale = max(height, width) / max_side
+    if scale <= 1:
+        return gray, 1.0
+    size = (max(1, round(width / scale)), max(1, round(height / scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+def metadata_suspicion(metadata):
+    """How strongly the header metadata alone points at editing, from 0 to 1"""
+    if 'error' in metadata:
+        return 0.0
+    if editing_software(metadata):
+        return 1.0
+    if metadata.get('exif_dimensions_mismatch') or (metadata.get('thumbnail') or {}).get('mismatch'):
+        return 0.8
+    if metadata.get('datetime') and metadata.get('datetime_original') and metadata['datetime'] != metadata['datetime_original']:
+        return 0.6
+    return 0.0
+
+def triage_signals(compression, cloning, ml_probability, metadata):
+    """Suspicion from each cheap check, from 0 to 1
+
+    The DCT and ORB signals reach 1.0 where the full analysis would flag
+    compression artifacts or a copied region; the CNN signal is the model's
+    forgery probability.
+    """
+    grid = compression['jpeg_grid']
+    return {
+        'cnn': ml_probability or 0.0,
+        'dct': 1.0 if grid['double_quantization'] else min(1.0, compression['compression_score'] / 0.02),
+        'orb': min(1.0, cloning['cloning_score'] / 4),
+        'metadata': metadata_suspicion(metadata)
+    }
+
+def triage_image(ctx, model, metadata, threshold=0.6, crop_size=512, max_side=512):
+    """Screen an ImageContext with cheap checks and decide whether it needs the full analysis
+
+    The DCT grid check runs on a native-resolution center crop (resampling
+    would erase the 8x8 blocking it measures), ORB copy-move matching on a
+    pyramid level (COPY_MOVE_MODES['triage']), region statistics on a copy
+    whose longer side is `max_side`, and the CNN on its usual 224x224 input, whose probability is cached on the
+    context for the full analysis to reuse. The image is escalated when
+    the strongest signal reaches `threshold`.
+
+    Returns {'score', 'threshold', 'signals', 'escalate'}; images that are
+    not escalated also get 'forgery_detection' and 'region_analysis' in the
+    full analysis' schema.
+    """
+    gray = ctx.gray
+    compression = analyze_compression(center_crop(gray, crop_size))
+    cloning = analyze_cloning(gray, 'triage')
+    ml_probability = None if model is None else predict_ml(ctx, model)
+
+    signals = triage_signals(compression, cloning, ml_probability, metadata)
+    score = max(signals.values())
+    result = {
+        'score': float(score),
+        'threshold': threshold,
+        'signals': signals,
+        'escalate': bool(score >= threshold)
+    }
+    if not result['escalate']:
+        small, scale = downscale(gray, max_side)
+        result['forgery_detection'] = merge_forgery_results(compression, cloning, ml_probability)
+        result['region_analysis'] = scale_regions(region_statistics(small), scale)
+    return result